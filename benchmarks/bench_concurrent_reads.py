@@ -0,0 +1,99 @@
+"""Задержка чтений бота, пока цикл проверки пишет большие снапшоты.
+
+Сравнивает чтение через пишущее соединение (DB_READ_CONNECTIONS=0, как раньше)
+с пулом читающих соединений в WAL.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_concurrent_reads.py [targets items_per_target]
+"""
+import asyncio
+import hashlib
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from config import config  # noqa: E402
+from database import Database  # noqa: E402
+
+TARGETS = 50
+ITEMS = 5_000
+READERS = 4
+# Пауза между запросами одного «пользователя»: бот читает часто, но не в холостом цикле
+READ_PAUSE = 0.005
+
+
+def make_items(n: int, seed: str) -> dict[int, int]:
+    return {
+        int.from_bytes(hashlib.md5(f"{seed}_{i}".encode()).digest()[:8], "big", signed=True): i % 500
+        for i in range(n)
+    }
+
+
+async def write_cycle(db: Database, targets: int, items: int):
+    """Цикл проверки: у каждой цели половина инвентаря сменилась"""
+    for t in range(targets):
+        steamid = str(76561190000000000 + t)
+        old = make_items(items // 2, f"{t}_old")
+        await db.apply_snapshot_diff(steamid, 730, make_items(items // 2, f"{t}_new"), set(old))
+        await db.save_fingerprint(steamid, 730, items, f"{t:016x}")
+        await asyncio.sleep(0)
+
+
+async def bot_reads(db: Database, stop: asyncio.Event, latencies: list[float]):
+    """Чтения бота: подписки пользователя и отпечаток/снапшот цели"""
+    i = 0
+    while not stop.is_set():
+        steamid = str(76561190000000000 + i % 10)
+        started = time.perf_counter()
+        await db.get_tracked_users(tg_user_id=i % 100 + 1)
+        await db.get_fingerprint(steamid, 730)
+        latencies.append(time.perf_counter() - started)
+        i += 1
+        await asyncio.sleep(READ_PAUSE)
+
+
+async def run(read_connections: int, targets: int, items: int) -> tuple[float, list[float]]:
+    config.DB_READ_CONNECTIONS = read_connections
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(str(Path(tmp) / "bench.db"))
+        await db.connect()
+        try:
+            for t in range(targets):
+                steamid = str(76561190000000000 + t)
+                await db.add_tracked_user(t % 100 + 1, steamid, 730)
+                await db.apply_snapshot_diff(steamid, 730, make_items(items // 2, f"{t}_old"), set())
+
+            stop = asyncio.Event()
+            latencies: list[float] = []
+            readers = [asyncio.create_task(bot_reads(db, stop, latencies)) for _ in range(READERS)]
+            started = time.perf_counter()
+            await write_cycle(db, targets, items)
+            elapsed = time.perf_counter() - started
+            stop.set()
+            await asyncio.gather(*readers)
+            return elapsed, latencies
+        finally:
+            await db.close()
+
+
+def report(name: str, elapsed: float, latencies: list[float]):
+    latencies.sort()
+    p99 = latencies[int(len(latencies) * 0.99)]
+    print(f"{name:<22} | {elapsed:>8.2f} | {len(latencies):>7} | "
+          f"{statistics.median(latencies) * 1000:>8.2f} | {p99 * 1000:>8.2f} | {latencies[-1] * 1000:>8.2f}")
+
+
+async def main(targets: int, items: int):
+    print(f"{targets} целей по {items} предметов, {READERS} читателя")
+    print(f"{'mode':<22} | {'cycle, s':>8} | {'reads':>7} | {'p50, ms':>8} | {'p99, ms':>8} | {'max, ms':>8}")
+    report("shared connection", *await run(0, targets, items))
+    report("WAL + 2 readers", *await run(2, targets, items))
+
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:]]
+    asyncio.run(main(*(args or [TARGETS, ITEMS])))
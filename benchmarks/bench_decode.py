@@ -0,0 +1,105 @@
+"""Время разбора и пиковая память декодеров ответа /inventory.
+
+Синтетические ответы повторяют форму Steam: у каждого описания тяжёлые блобы
+(descriptions, tags, actions), которые боту не нужны. Записанного ответа Steam в репозитории
+нет — для замера на реальной форме передайте свой через --sample, его первый asset
+и description станут шаблоном.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_decode.py [--sample response.json] [1000 10000 50000]
+"""
+import argparse
+import copy
+import json
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import steam_json  # noqa: E402
+
+SIZES = [1_000, 10_000, 50_000]
+REPEATS = 3
+
+ASSET_TEMPLATE = {"appid": 730, "contextid": "2", "assetid": "0", "classid": "0",
+                  "instanceid": "0", "amount": "1"}
+DESCRIPTION_TEMPLATE = {
+    "appid": 730, "classid": "0", "instanceid": "0", "currency": 0,
+    "background_color": "", "icon_url": "i0xl" * 40, "icon_url_large": "i0xl" * 40,
+    "descriptions": [{"type": "html", "value": "Exterior: Field-Tested " * 8}] * 6,
+    "tradable": 1, "actions": [{"link": "steam://rungame/730/" + "0" * 60, "name": "Inspect in Game..."}],
+    "name": "AK-47 | Redline", "name_color": "D2D2D2", "type": "Classified Rifle",
+    "market_name": "AK-47 | Redline (Field-Tested)",
+    "market_hash_name": "AK-47 | Redline (Field-Tested)",
+    "market_actions": [{"link": "steam://rungame/730/" + "0" * 60, "name": "Inspect in Game..."}],
+    "commodity": 0, "market_tradable_restriction": 7, "marketable": 1,
+    "tags": [{"category": f"Cat{i}", "internal_name": f"tag_{i}", "localized_category_name": "Category",
+              "localized_tag_name": "Tag", "color": "D2D2D2"} for i in range(6)],
+}
+
+
+def make_body(n: int, asset_template: dict, description_template: dict) -> bytes:
+    """Каждый второй предмет — уникальный класс, чтобы descriptions были соразмерны assets"""
+    assets, descriptions = [], []
+    for i in range(n):
+        classid = str(1_000_000 + i // 2)
+        asset = dict(asset_template, assetid=str(30_000_000_000 + i), classid=classid, instanceid="0")
+        assets.append(asset)
+        if i % 2 == 0:
+            desc = copy.deepcopy(description_template)
+            desc.update(classid=classid, instanceid="0", market_hash_name=f"Item {classid}")
+            descriptions.append(desc)
+    return json.dumps({
+        "assets": assets, "descriptions": descriptions, "more_items": 0,
+        "total_inventory_count": n, "success": 1, "rwgrsn": -2,
+    }).encode()
+
+
+def load_templates(path: str) -> tuple[dict, dict]:
+    data = json.loads(Path(path).read_text())
+    return data["assets"][0], data["descriptions"][0]
+
+
+def measure(decode, body: bytes) -> tuple[float, int]:
+    best = float("inf")
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        decode(body)
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    data = decode(body)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del data
+    return best, peak
+
+
+def decoders() -> dict:
+    result = {"json (raw)": json.loads, "json": steam_json.get_decoder("json")}
+    if steam_json.orjson is not None:
+        result["orjson"] = steam_json.get_decoder("orjson")
+    if steam_json.msgspec is not None:
+        result["msgspec"] = steam_json.get_decoder("msgspec")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sample", help="записанный ответ /inventory для шаблона предметов")
+    parser.add_argument("sizes", nargs="*", type=int, default=SIZES)
+    args = parser.parse_args()
+
+    templates = load_templates(args.sample) if args.sample else (ASSET_TEMPLATE, DESCRIPTION_TEMPLATE)
+    for n in args.sizes:
+        body = make_body(n, *templates)
+        print(f"{n:>7} предметов, тело {len(body) / 2**20:.1f} МБ")
+        for name, decode in decoders().items():
+            elapsed, peak = measure(decode, body)
+            print(f"    {name:<12} {elapsed * 1000:8.1f} мс   пик {peak / 2**20:7.1f} МБ")
+
+
+if __name__ == "__main__":
+    main()
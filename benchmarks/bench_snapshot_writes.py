@@ -0,0 +1,69 @@
+"""Сравнение пакетной записи снапшота с прежним циклом INSERT по одному хешу.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_snapshot_writes.py [1000 10000 100000]
+"""
+import asyncio
+import hashlib
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from database import Database  # noqa: E402
+
+SIZES = [1_000, 10_000, 100_000]
+STEAMID = "76561199109461098"
+APPID = 730
+
+
+def make_hashes(n: int, seed: str) -> set[int]:
+    return {
+        int.from_bytes(hashlib.md5(f"{seed}_{i}".encode()).digest()[:8], "big", signed=True)
+        for i in range(n)
+    }
+
+
+async def legacy_save(db: Database, steamid64: str, appid: int, hashes: set[int]):
+    """Прежняя реализация: один INSERT на хеш через поток aiosqlite"""
+    for h in hashes:
+        await db._connection.execute(
+            "INSERT OR IGNORE INTO inventory_items (steamid64, appid, item_key) VALUES (?, ?, ?)",
+            (int(steamid64), appid, h)
+        )
+    await db._connection.commit()
+
+
+async def batched_save(db: Database, steamid64: str, appid: int, hashes: set[int]):
+    await db.apply_snapshot_diff(steamid64, appid, dict.fromkeys(hashes), set())
+
+
+async def run(save, n: int) -> float:
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(str(Path(tmp) / "bench.db"))
+        await db.connect()
+        try:
+            # Половина хешей уже в снапшоте — как у инвентаря, который частично изменился
+            await db.apply_snapshot_diff(STEAMID, APPID, dict.fromkeys(make_hashes(n // 2, "old")), set())
+            hashes = make_hashes(n // 2, "old") | make_hashes(n - n // 2, "new")
+
+            started = time.perf_counter()
+            await save(db, STEAMID, APPID, hashes)
+            return time.perf_counter() - started
+        finally:
+            await db.close()
+
+
+async def main(sizes: list[int]):
+    print(f"{'hashes':>8} | {'loop, s':>9} | {'batch, s':>9} | {'loop/s':>10} | {'batch/s':>10} | speedup")
+    for n in sizes:
+        legacy = await run(legacy_save, n)
+        batched = await run(batched_save, n)
+        print(f"{n:>8} | {legacy:>9.3f} | {batched:>9.3f} | "
+              f"{n / legacy:>10.0f} | {n / batched:>10.0f} | x{legacy / batched:.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main([int(a) for a in sys.argv[1:]] or SIZES))
@@ -0,0 +1,208 @@
+"""Приём обновлений Telegram: вебхук против long polling.
+
+Фальшивый отправитель с заданным темпом шлёт обновления (/start и /list от разных
+чатов) — в режиме webhook POST-ом на WebhookServer, в режиме polling через getUpdates
+локальной замены Telegram. Задержка — от отправки обновления до ответа бота
+(sendMessage в ту же замену), пропускная способность — обработанные обновления в секунду.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_webhook.py --updates 2000 --rate 500 --senders 40 --concurrency 40
+"""
+import argparse
+import asyncio
+import contextlib
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import aiohttp  # noqa: E402
+from aiohttp import web  # noqa: E402
+
+from fake_telegram import FakeTelegram  # noqa: E402
+
+TELEGRAM_PORT = 8766
+WEBHOOK_PORT = 8767
+SECRET = "bench-secret"
+FIRST_CHAT = 1_000_000
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--rate", type=float, default=500, help="обновлений в секунду, 0 — без паузы")
+    parser.add_argument("--senders", type=int, default=40, help="соединений отправителя (max_connections у Telegram)")
+    parser.add_argument("--concurrency", type=int, default=40, help="WEBHOOK_MAX_CONCURRENCY")
+    parser.add_argument("--mode", choices=("webhook", "polling", "both"), default="both")
+    return parser.parse_args()
+
+
+def configure(args: argparse.Namespace, db_path: str):
+    """Конфиг читается из окружения при импорте — задаём его до импорта модулей бота"""
+    os.environ.update({
+        "BOT_TOKEN": "123456:fake-token",
+        "DATABASE_PATH": db_path,
+        "METRICS_PORT": "0",
+        "BOT_MODE": "webhook",
+        "WEBHOOK_URL": f"http://127.0.0.1:{WEBHOOK_PORT}/telegram",
+        "WEBHOOK_PATH": "/telegram",
+        "WEBHOOK_SECRET": SECRET,
+        "WEBHOOK_MAX_CONCURRENCY": str(args.concurrency),
+    })
+
+
+def make_update(update_id: int, chat_id: int) -> dict:
+    text = "/start" if update_id % 2 else "/list"
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "Bench"},
+            "text": text,
+            "entities": [{"type": "bot_command", "offset": 0, "length": len(text)}],
+        },
+    }
+
+
+def percentile(values: list[float], p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+async def paced(args: argparse.Namespace, first_id: int):
+    """Выдаёт (update_id, chat_id) с темпом args.rate"""
+    started = time.perf_counter()
+    for i in range(args.updates):
+        if args.rate:
+            delay = started + i / args.rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        yield first_id + i, FIRST_CHAT + first_id + i
+
+
+async def wait_replies(telegram: FakeTelegram, sent: dict[int, float], timeout: float = 60) -> dict[int, float]:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        replied = {}
+        for chat_id, received, _ in telegram.messages:
+            if chat_id in sent:
+                replied.setdefault(chat_id, received)
+        if len(replied) >= len(sent):
+            break
+        await asyncio.sleep(0.05)
+    return replied
+
+
+async def run_webhook(args, bot, dp, telegram: FakeTelegram, first_id: int) -> tuple[dict, dict]:
+    from webhook import WebhookServer
+
+    server = WebhookServer(bot, dp)
+    await server.start(port=WEBHOOK_PORT)
+    url = f"http://127.0.0.1:{WEBHOOK_PORT}/telegram"
+    sent: dict[int, float] = {}
+    queue: asyncio.Queue = asyncio.Queue(maxsize=args.senders)
+
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=args.senders)) as http:
+        async with http.post(url, json=make_update(first_id - 1, FIRST_CHAT),
+                             headers={"X-Telegram-Bot-Api-Secret-Token": "wrong"}) as r:
+            assert r.status == 401, f"неверный секрет принят: {r.status}"
+
+        async def sender():
+            while (item := await queue.get()) is not None:
+                update_id, chat_id = item
+                sent[chat_id] = time.time()
+                async with http.post(url, json=make_update(update_id, chat_id),
+                                     headers={"X-Telegram-Bot-Api-Secret-Token": SECRET}) as r:
+                    assert r.status == 200, r.status
+
+        senders = [asyncio.create_task(sender()) for _ in range(args.senders)]
+        async for item in paced(args, first_id):
+            await queue.put(item)
+        for _ in senders:
+            await queue.put(None)
+        await asyncio.gather(*senders)
+
+    replied = await wait_replies(telegram, sent)
+    await server.stop()
+    return sent, replied
+
+
+async def run_polling(args, bot, dp, telegram: FakeTelegram, first_id: int) -> tuple[dict, dict]:
+    sent: dict[int, float] = {}
+    polling = asyncio.create_task(dp.start_polling(bot, handle_signals=False, close_bot_session=False))
+    async for update_id, chat_id in paced(args, first_id):
+        sent[chat_id] = time.time()
+        telegram.push_update(make_update(update_id, chat_id))
+    replied = await wait_replies(telegram, sent)
+    await dp.stop_polling()
+    await polling
+    return sent, replied
+
+
+def report(mode: str, sent: dict[int, float], replied: dict[int, float]):
+    if not replied:
+        print(f"{mode:<8} | ответов нет")
+        return
+    latencies = [(replied[chat_id] - sent[chat_id]) * 1000 for chat_id in replied]
+    elapsed = max(replied.values()) - min(sent.values())
+    print(f"{mode:<8} | {len(replied):>5}/{len(sent):<5} | {len(replied) / elapsed:>9.0f} | "
+          f"{statistics.median(latencies):>7.1f} | {percentile(latencies, 0.99):>7.1f} | {max(latencies):>7.1f}")
+
+
+async def run(args: argparse.Namespace):
+    from aiogram import Bot, Dispatcher
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+    from database import db
+    from steam_api import SteamInventoryFetcher
+    from proxy_pool import ProxyPool
+    from telegram_bot import InventoryBot
+
+    # Хендлеры логируют каждое сообщение — в замере это только шум
+    logging.disable(logging.INFO)
+
+    telegram = FakeTelegram()
+    telegram_runner = web.AppRunner(telegram.make_app(), access_log=None)
+    await telegram_runner.setup()
+    await web.TCPSite(telegram_runner, "127.0.0.1", TELEGRAM_PORT).start()
+
+    with contextlib.redirect_stdout(open(os.devnull, "w")):
+        await db.connect()
+    fetcher = SteamInventoryFetcher(ProxyPool.from_config())
+    session = AiohttpSession(api=TelegramAPIServer.from_base(f"http://127.0.0.1:{TELEGRAM_PORT}"))
+    bot = Bot(token="123456:fake-token", session=session)
+    dp = Dispatcher()
+    InventoryBot(bot, dp, fetcher)
+
+    modes = ("webhook", "polling") if args.mode == "both" else (args.mode,)
+    print(f"{args.updates} обновлений, темп {args.rate or 'max'}/с, отправителей {args.senders}, "
+          f"WEBHOOK_MAX_CONCURRENCY={args.concurrency}")
+    print(f"{'mode':<8} | {'ответов':>11} | {'updates/s':>9} | {'p50, ms':>7} | {'p99, ms':>7} | {'max, ms':>7}")
+    try:
+        for n, mode in enumerate(modes):
+            runner = run_webhook if mode == "webhook" else run_polling
+            # У каждого режима свои update_id и чаты, чтобы не путать ответы
+            report(mode, *await runner(args, bot, dp, telegram, 1 + n * (args.updates + 1)))
+    finally:
+        await bot.session.close()
+        with contextlib.redirect_stdout(open(os.devnull, "w")):
+            await db.close()
+        await telegram_runner.cleanup()
+
+
+def main():
+    args = parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        configure(args, str(Path(tmp) / "bench.db"))
+        asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""Локальная замена steamcommunity.com/inventory для нагрузочных тестов.
+
+Инвентарь каждой цели генерируется детерминированно по SteamID при первом запросе.
+POST /_mutate добавляет новые предметы доле целей и возвращает их названия с временем
+появления — по ним считается задержка обнаружения.
+
+Отдельный запуск:
+    python benchmarks/fake_steam.py --port 8765 --items 50 --latency-ms 20 --rate-limit 0.01
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from dataclasses import dataclass
+from aiohttp import web
+
+# Описания как у Steam: тяжёлые блобы, которые бот должен пропускать
+DESCRIPTION_BLOB = {
+    "descriptions": [{"type": "html", "value": "Exterior: Field-Tested"}] * 3,
+    "tags": [{"category": "Type", "internal_name": "CSGO_Type_Rifle", "localized_tag_name": "Rifle"}] * 3,
+    "icon_url": "i0xl" * 40,
+}
+
+
+@dataclass
+class SteamOptions:
+    items: int = 50
+    # Доля запросов, на которые отвечаем 429
+    rate_limit: float = 0.0
+    # Средняя задержка ответа, мс (равномерно от половины до полутора)
+    latency_ms: float = 0.0
+    page_size: int = 2000
+
+
+class FakeSteam:
+    def __init__(self, options: SteamOptions):
+        self.options = options
+        # steamid -> [(assetid, classid)]
+        self.inventories: dict[str, list[tuple[int, int]]] = {}
+        # Готовые тела ответов: пересобираются только после изменения инвентаря
+        self._bodies: dict[str, dict[int, bytes]] = {}
+        self._next_classid = 10_000_000
+        self.requests = 0
+        self.rate_limited = 0
+
+    def inventory(self, steamid: str) -> list[tuple[int, int]]:
+        items = self.inventories.get(steamid)
+        if items is None:
+            base = int(steamid) % 1_000_000 * 100_000
+            items = self.inventories[steamid] = [
+                (base + j, j % 500 + 1) for j in range(self.options.items)
+            ]
+        return items
+
+    def mutate(self, fraction: float) -> dict[str, float]:
+        """Добавляет по новому предмету доле целей; возвращает название -> время появления"""
+        changed = {}
+        now = time.time()
+        for steamid in random.sample(list(self.inventories), int(len(self.inventories) * fraction)):
+            items = self.inventories[steamid]
+            self._next_classid += 1
+            items.append((items[-1][0] + 1, self._next_classid))
+            self._bodies.pop(steamid, None)
+            changed[f"Item {self._next_classid}"] = now
+        return changed
+
+    def page(self, steamid: str, appid: int, start_assetid: str | None) -> bytes:
+        pages = self._bodies.setdefault(steamid, {})
+        body = pages.get(int(start_assetid or 0))
+        if body is not None:
+            return body
+
+        items = self.inventory(steamid)
+        start = 0
+        if start_assetid:
+            start = next(i for i, (assetid, _) in enumerate(items) if assetid == int(start_assetid)) + 1
+        page = items[start:start + self.options.page_size]
+        data = {
+            "assets": [
+                {"appid": appid, "contextid": "2", "assetid": str(assetid),
+                 "classid": str(classid), "instanceid": "0", "amount": "1"}
+                for assetid, classid in page
+            ],
+            "descriptions": [
+                {"appid": appid, "classid": str(classid), "instanceid": "0",
+                 "market_hash_name": f"Item {classid}", "name": f"Item {classid}", **DESCRIPTION_BLOB}
+                for classid in dict.fromkeys(classid for _, classid in page)
+            ],
+            "total_inventory_count": len(items),
+            "success": 1,
+        }
+        if start + len(page) < len(items):
+            data["more_items"] = 1
+            data["last_assetid"] = str(page[-1][0])
+        body = pages[int(start_assetid or 0)] = json.dumps(data).encode()
+        return body
+
+    async def handle_inventory(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        if self.options.latency_ms:
+            await asyncio.sleep(self.options.latency_ms / 1000 * random.uniform(0.5, 1.5))
+        if random.random() < self.options.rate_limit:
+            self.rate_limited += 1
+            return web.Response(status=429)
+        body = self.page(request.match_info["steamid"], int(request.match_info["appid"]),
+                         request.query.get("start_assetid"))
+        return web.Response(body=body, content_type="application/json")
+
+    async def handle_mutate(self, request: web.Request) -> web.Response:
+        fraction = float(request.query.get("fraction", "0.01"))
+        return web.json_response(self.mutate(fraction))
+
+    async def handle_stats(self, request: web.Request) -> web.Response:
+        return web.json_response({"requests": self.requests, "rate_limited": self.rate_limited})
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/inventory/{steamid}/{appid}/{contextid}", self.handle_inventory)
+        app.router.add_post("/_mutate", self.handle_mutate)
+        app.router.add_get("/_stats", self.handle_stats)
+        return app
+
+
+def serve(port: int, options: SteamOptions):
+    """Точка входа для отдельного процесса"""
+    web.run_app(FakeSteam(options).make_app(), host="127.0.0.1", port=port,
+                access_log=None, print=None)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--items", type=int, default=50)
+    parser.add_argument("--rate-limit", type=float, default=0.0)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    args = parser.parse_args()
+    print(f"Fake Steam: http://127.0.0.1:{args.port}/inventory")
+    serve(args.port, SteamOptions(args.items, args.rate_limit, args.latency_ms))
@@ -0,0 +1,73 @@
+"""Локальная замена Telegram Bot API: принимает sendMessage и запоминает время получения,
+отдаёт подложенные обновления через getUpdates.
+
+Бот подключается к ней через сессию aiogram с другим адресом API:
+    AiohttpSession(api=TelegramAPIServer.from_base("http://127.0.0.1:8081"))
+"""
+import asyncio
+import random
+import time
+from aiohttp import web
+
+
+class FakeTelegram:
+    def __init__(self, rate_limit: float = 0.0, retry_after: int = 1):
+        # Доля запросов, на которые отвечаем 429 с retry_after
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        # (chat_id, время получения, текст)
+        self.messages: list[tuple[int, float, str]] = []
+        self.rate_limited = 0
+        self._message_id = 0
+        # Обновления для long polling
+        self.updates: list[dict] = []
+        self._new_updates = asyncio.Event()
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        data = await request.post()
+        if method == "getMe":
+            return web.json_response({"ok": True, "result": {
+                "id": 123456, "is_bot": True, "first_name": "Fake", "username": "fake_bot",
+            }})
+        if method == "getUpdates":
+            return web.json_response({"ok": True, "result": await self._get_updates(data)})
+        if method != "sendMessage":
+            return web.json_response({"ok": True, "result": True})
+
+        if random.random() < self.rate_limit:
+            self.rate_limited += 1
+            return web.json_response({
+                "ok": False, "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after},
+            })
+
+        chat_id = int(data["chat_id"])
+        self.messages.append((chat_id, time.time(), data["text"]))
+        self._message_id += 1
+        return web.json_response({"ok": True, "result": {
+            "message_id": self._message_id, "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"}, "text": data["text"],
+        }})
+
+    def push_update(self, update: dict):
+        self.updates.append(update)
+        self._new_updates.set()
+
+    async def _get_updates(self, data) -> list[dict]:
+        # Как у Telegram: подтверждённые offset-ом выбрасываем, пустой ответ — только по таймауту
+        offset = int(data.get("offset", 0))
+        self.updates = [u for u in self.updates if u["update_id"] >= offset]
+        if not self.updates:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), float(data.get("timeout", 0)))
+            except asyncio.TimeoutError:
+                pass
+        return self.updates[:int(data.get("limit", 100))]
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        return app
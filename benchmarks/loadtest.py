@@ -0,0 +1,212 @@
+"""Сквозной нагрузочный тест: InventoryChecker + SteamInventoryFetcher + Database
+против локальных Steam (отдельный процесс) и Telegram.
+
+Сценарий: засеять снапшоты всех целей, затем несколько раундов «изменить долю
+инвентарей -> цикл проверки». Отчёт: цели в секунду, задержка обнаружения
+(от появления предмета в Steam до получения сообщения в Telegram) и память.
+
+Запуск из корня репозитория:
+    python benchmarks/loadtest.py --targets 10000 --items 50 --change-rate 0.01 \\
+        --rounds 3 --rate-limit 0.005 --latency-ms 20
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import multiprocessing
+import os
+import re
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import aiohttp  # noqa: E402
+from aiohttp import web  # noqa: E402
+
+from fake_steam import SteamOptions, serve  # noqa: E402
+from fake_telegram import FakeTelegram  # noqa: E402
+
+STEAM_PORT = 8765
+TELEGRAM_PORT = 8766
+FIRST_STEAMID = 76561190000000000
+ITEM_NAME = re.compile(r"Item \d+")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--targets", type=int, default=10_000)
+    parser.add_argument("--items", type=int, default=50, help="предметов в инвентаре")
+    parser.add_argument("--subscribers", type=int, default=1, help="подписчиков на цель")
+    parser.add_argument("--change-rate", type=float, default=0.01, help="доля инвентарей, меняющихся за раунд")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="доля ответов Steam с 429")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="средняя задержка Steam")
+    parser.add_argument("--telegram-rate-limit", type=float, default=0.0, help="доля ответов Telegram с 429")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--steam-rps", type=float, default=100_000)
+    parser.add_argument("--telegram-rps", type=float, default=1_000)
+    parser.add_argument("--cooldown", type=float, default=0.5, help="пауза прокси после 429, с")
+    parser.add_argument("--verbose", action="store_true", help="не глушить вывод бота")
+    return parser.parse_args()
+
+
+def configure(args: argparse.Namespace, db_path: str):
+    """Конфиг читается из окружения при импорте — задаём его до импорта модулей бота"""
+    os.environ.update({
+        "BOT_TOKEN": "123456:fake-token",
+        "DATABASE_PATH": db_path,
+        "METRICS_PORT": "0",
+        "STEAM_REQUESTS_PER_SECOND": str(args.steam_rps),
+        "STEAM_RATE_BURST": str(args.concurrency),
+        "STEAM_MAX_CONCURRENCY": str(args.concurrency),
+        "PROXY_URLS": "",
+        "PROXY_RATE_LIMIT_COOLDOWN": str(args.cooldown),
+        "PROXY_ERROR_COOLDOWN": str(args.cooldown),
+        # Раунды идут подряд быстрее TTL кеша страниц — иначе изменения не будут видны
+        "FETCH_CACHE_SECONDS": "0",
+        "TELEGRAM_MESSAGES_PER_SECOND": str(args.telegram_rps),
+        "TELEGRAM_RATE_BURST": "50",
+        "TELEGRAM_CHAT_INTERVAL": "0",
+        "NOTIFY_QUEUE_SIZE": str(max(10_000, args.targets * args.subscribers)),
+    })
+
+
+def percentile(values: list[float], p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def rss_mb() -> float:
+    # ru_maxrss в Linux — в килобайтах
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def wait_for_port(url: str):
+    async with aiohttp.ClientSession() as session:
+        for _ in range(100):
+            try:
+                async with session.get(url):
+                    return
+            except aiohttp.ClientError:
+                await asyncio.sleep(0.1)
+    raise RuntimeError(f"{url} не поднялся")
+
+
+async def run(args: argparse.Namespace):
+    from aiogram import Bot, Dispatcher
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+    import metrics
+    from database import db
+    from notifier import NotificationDispatcher
+    from proxy_pool import ProxyPool
+    from scheduler import InventoryChecker, TargetSchedule
+    from steam_api import SteamInventoryFetcher
+    from telegram_bot import InventoryBot
+
+    quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(open(os.devnull, "w"))
+
+    steam = multiprocessing.Process(
+        target=serve,
+        args=(STEAM_PORT, SteamOptions(args.items, args.rate_limit, args.latency_ms)),
+        daemon=True
+    )
+    steam.start()
+    steam_url = f"http://127.0.0.1:{STEAM_PORT}"
+    await wait_for_port(f"{steam_url}/_stats")
+
+    telegram = FakeTelegram(args.telegram_rate_limit)
+    telegram_runner = web.AppRunner(telegram.make_app(), access_log=None)
+    await telegram_runner.setup()
+    await web.TCPSite(telegram_runner, "127.0.0.1", TELEGRAM_PORT).start()
+
+    await db.connect()
+    # Подписки — одной пачкой, как после долгой работы бота
+    await db._connection.executemany(
+        "INSERT INTO tracked_users (tg_user_id, steamid64, appid) VALUES (?, ?, 730)",
+        ((t * args.subscribers + s + 1, str(FIRST_STEAMID + t))
+         for t in range(args.targets) for s in range(args.subscribers))
+    )
+    await db._connection.commit()
+    await db.reload_subscriptions()
+
+    SteamInventoryFetcher.BASE_URL = f"{steam_url}/inventory"
+    fetcher = SteamInventoryFetcher(ProxyPool.from_config())
+    await fetcher.open()
+
+    session = AiohttpSession(api=TelegramAPIServer.from_base(f"http://127.0.0.1:{TELEGRAM_PORT}"))
+    bot = Bot(token="123456:fake-token", session=session)
+    notifier = NotificationDispatcher(InventoryBot(bot, Dispatcher(), fetcher))
+    checker = InventoryChecker(notifier, fetcher)
+
+    async def cycle() -> float:
+        # Свежее расписание: все цели сразу к проверке
+        checker.schedule = TargetSchedule()
+        started = time.perf_counter()
+        with quiet:
+            await checker._check_all()
+        return time.perf_counter() - started
+
+    expected: dict[str, float] = {}
+    try:
+        with quiet:
+            await notifier.start()
+
+        print(f"{args.targets} целей x {args.items} предметов, подписчиков на цель: {args.subscribers}")
+        print(f"{'phase':<10} | {'cycle, s':>8} | {'targets/s':>9} | {'rss, MB':>8}")
+        elapsed = await cycle()
+        print(f"{'seed':<10} | {elapsed:>8.2f} | {args.targets / elapsed:>9.0f} | {rss_mb():>8.0f}")
+
+        async with aiohttp.ClientSession() as http:
+            for i in range(args.rounds):
+                async with http.post(f"{steam_url}/_mutate", params={"fraction": args.change_rate}) as r:
+                    expected.update(await r.json())
+                elapsed = await cycle()
+                print(f"{f'round {i + 1}':<10} | {elapsed:>8.2f} | {args.targets / elapsed:>9.0f} | {rss_mb():>8.0f}")
+            async with http.get(f"{steam_url}/_stats") as r:
+                steam_stats = await r.json()
+
+        # Ждём, пока диспетчер дошлёт всё, что обнаружено
+        deadline = time.time() + 30
+        while notifier.queue_size and time.time() < deadline:
+            await asyncio.sleep(0.1)
+        with quiet:
+            await notifier.stop()
+    finally:
+        await fetcher.close()
+        await bot.session.close()
+        await db.close()
+        await telegram_runner.cleanup()
+        steam.terminate()
+
+    detected = {}
+    for _, received, text in telegram.messages:
+        for name in ITEM_NAME.findall(text):
+            if name in expected:
+                detected.setdefault(name, received - expected[name])
+
+    checks = {values[0]: int(child.value) for values, child in metrics.CHECKS._children.items()}
+    print(f"\nпроверки: {json.dumps(checks)}; Steam: {steam_stats['requests']} запросов, "
+          f"429: {steam_stats['rate_limited']}; Telegram 429: {telegram.rate_limited}")
+    print(f"обнаружено {len(detected)} из {len(expected)} новых предметов")
+    if detected:
+        latencies = list(detected.values())
+        print(f"задержка обнаружения: p50 {statistics.median(latencies):.2f}s, "
+              f"p99 {percentile(latencies, 0.99):.2f}s, max {max(latencies):.2f}s")
+    print(f"пиковая память процесса: {rss_mb():.0f} MB")
+
+
+def main():
+    args = parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        configure(args, str(Path(tmp) / "loadtest.db"))
+        asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,6 @@
 import os
+import re
+import socket
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -7,24 +9,145 @@ load_dotenv()
 BASE_DIR = Path(__file__).parent
 
 
+def _split_list(value: str | None) -> list[str]:
+    return [part.strip() for part in (value or "").split(",") if part.strip()]
+
+
 class Config:
     BOT_TOKEN: str = os.getenv("BOT_TOKEN", "")
     DATABASE_PATH: str = os.getenv("DATABASE_PATH", str(BASE_DIR / "data" / "bot.db"))
     CHECK_INTERVAL_MINUTES: int = int(os.getenv("CHECK_INTERVAL_MINUTES", "10"))
+    # Адаптивный опрос: у каждой цели свой интервал в пределах [MIN, MAX]
+    CHECK_TICK_SECONDS: int = int(os.getenv("CHECK_TICK_SECONDS", "30"))
+    CHECK_MIN_INTERVAL_SECONDS: int = int(os.getenv("CHECK_MIN_INTERVAL_SECONDS", "120"))
+    CHECK_MAX_INTERVAL_MINUTES: int = int(os.getenv("CHECK_MAX_INTERVAL_MINUTES", "360"))
+    CHECK_COOLDOWN_FACTOR: float = float(os.getenv("CHECK_COOLDOWN_FACTOR", "1.5"))
     STEAM_REQUEST_DELAY: float = float(os.getenv("STEAM_REQUEST_DELAY", "3"))
     PROXY_URL: str | None = os.getenv("PROXY_URL")
+    # Пул прокси через запятую; без него — один PROXY_URL или прямое соединение
+    PROXY_URLS: list[str] = _split_list(os.getenv("PROXY_URLS") or os.getenv("PROXY_URL"))
+    # Пауза прокси после 429 и после таймаута/сетевой ошибки (растёт с каждым провалом подряд)
+    PROXY_RATE_LIMIT_COOLDOWN: float = float(os.getenv("PROXY_RATE_LIMIT_COOLDOWN", "30"))
+    PROXY_ERROR_COOLDOWN: float = float(os.getenv("PROXY_ERROR_COOLDOWN", os.getenv("STEAM_REQUEST_DELAY", "3")))
+    # Потолок паузы: прокси, который долго падал, всё равно периодически пробуем снова
+    PROXY_MAX_COOLDOWN: float = float(os.getenv("PROXY_MAX_COOLDOWN", "300"))
+
+    # Бюджет запросов к Steam: token bucket на каждый прокси + лимит одновременных запросов
+    STEAM_REQUESTS_PER_SECOND: float = float(os.getenv("STEAM_REQUESTS_PER_SECOND", "0.5"))
+    STEAM_RATE_BURST: int = int(os.getenv("STEAM_RATE_BURST", "3"))
+    STEAM_MAX_CONCURRENCY: int = int(os.getenv("STEAM_MAX_CONCURRENCY", "8"))
+
+    # Недавние страницы инвентаря отдаются из памяти (0 — без кеша); одинаковые запросы склеиваются всегда
+    FETCH_CACHE_SECONDS: float = float(os.getenv("FETCH_CACHE_SECONDS", "15"))
+    FETCH_CACHE_MAX_ASSETS: int = int(os.getenv("FETCH_CACHE_MAX_ASSETS", "100000"))
+
+    # Общий пул HTTP-соединений к Steam
+    STEAM_POOL_SIZE: int = int(os.getenv("STEAM_POOL_SIZE", "32"))
+    STEAM_POOL_PER_HOST: int = int(os.getenv("STEAM_POOL_PER_HOST", "16"))
+    STEAM_KEEPALIVE_SECONDS: float = float(os.getenv("STEAM_KEEPALIVE_SECONDS", "60"))
+    STEAM_DNS_CACHE_SECONDS: int = int(os.getenv("STEAM_DNS_CACHE_SECONDS", "300"))
+
+    # Шардирование: ROLE=all — всё в одном процессе; bot — Telegram и доставка;
+    # worker — только опрос своей доли целей (через собственный прокси)
+    ROLE: str = os.getenv("ROLE", "all")
+    WORKER_ID: str = os.getenv("WORKER_ID", f"{socket.gethostname()}-{os.getpid()}")
+    WORKER_PROXY_URLS: list[str] = _split_list(os.getenv("WORKER_PROXY_URLS") or os.getenv("WORKER_PROXY_URL")) \
+        or PROXY_URLS
+    SHARD_LEASE_SECONDS: int = int(os.getenv("SHARD_LEASE_SECONDS", "30"))
+    OUTBOX_POLL_SECONDS: float = float(os.getenv("OUTBOX_POLL_SECONDS", "2"))
+    DB_BUSY_TIMEOUT: float = float(os.getenv("DB_BUSY_TIMEOUT", "30"))
+
+    # SQLite: WAL, одно пишущее соединение и пул читающих (0 — читать через пишущее)
+    DB_READ_CONNECTIONS: int = int(os.getenv("DB_READ_CONNECTIONS", "2"))
+    DB_SYNCHRONOUS: str = os.getenv("DB_SYNCHRONOUS", "NORMAL")
+    DB_CACHE_SIZE_KB: int = int(os.getenv("DB_CACHE_SIZE_KB", "16384"))
+    DB_MMAP_SIZE: int = int(os.getenv("DB_MMAP_SIZE", str(256 * 1024 * 1024)))
+    DB_STATEMENT_CACHE: int = int(os.getenv("DB_STATEMENT_CACHE", "256"))
+    # Обслуживание БД в паузах между проверками: чистка снапшотов порциями, optimize, vacuum
+    DB_MAINTENANCE_MINUTES: int = int(os.getenv("DB_MAINTENANCE_MINUTES", "60"))
+    DB_GC_CHUNK: int = int(os.getenv("DB_GC_CHUNK", "5000"))
+    DB_VACUUM_PAGES: int = int(os.getenv("DB_VACUUM_PAGES", "2000"))
+
+    # Локальный эндпоинт метрик Prometheus (0 — выключен); воркерам на одной машине — разные порты
+    METRICS_HOST: str = os.getenv("METRICS_HOST", "127.0.0.1")
+    METRICS_PORT: int = int(os.getenv("METRICS_PORT", "9108"))
+
+    # Приём обновлений Telegram: polling или webhook. В режиме webhook /metrics отдаёт тот же
+    # aiohttp-сервер (METRICS_* не используются) — наружу через reverse proxy пробрасывайте только WEBHOOK_PATH
+    BOT_MODE: str = os.getenv("BOT_MODE", "polling")
+    WEBHOOK_URL: str = os.getenv("WEBHOOK_URL", "")  # публичный https-адрес, например https://bot.example.com/telegram
+    WEBHOOK_PATH: str = os.getenv("WEBHOOK_PATH", "/telegram")
+    WEBHOOK_HOST: str = os.getenv("WEBHOOK_HOST", "127.0.0.1")
+    WEBHOOK_PORT: int = int(os.getenv("WEBHOOK_PORT", "8080"))
+    # Telegram повторяет его в заголовке X-Telegram-Bot-Api-Secret-Token: 1-256 символов A-Z, a-z, 0-9, _ и -
+    WEBHOOK_SECRET: str = os.getenv("WEBHOOK_SECRET", "")
+    # Одновременно обрабатываемых обновлений; столько же соединений просим у Telegram (не больше 100)
+    WEBHOOK_MAX_CONCURRENCY: int = int(os.getenv("WEBHOOK_MAX_CONCURRENCY", "40"))
+
+    # Профилирование циклов проверки: PROFILE_CYCLES — профилировать первые N циклов после старта
+    # (то же делает команда /profile N для ADMIN_IDS); цикл дольше PROFILE_SLOW_CYCLE_SECONDS
+    # (0 — выключено) сохраняет трассу самых медленных целей. Всё пишется в PROFILE_DIR
+    ADMIN_IDS: list[int] = [int(x) for x in _split_list(os.getenv("ADMIN_IDS"))]
+    PROFILE_CYCLES: int = int(os.getenv("PROFILE_CYCLES", "0"))
+    PROFILE_DIR: str = os.getenv("PROFILE_DIR", str(BASE_DIR / "data" / "profiles"))
+    PROFILE_SAMPLE_MS: float = float(os.getenv("PROFILE_SAMPLE_MS", "5"))
+    PROFILE_SLOW_CALLBACK_MS: float = float(os.getenv("PROFILE_SLOW_CALLBACK_MS", "50"))
+    PROFILE_SLOW_CYCLE_SECONDS: float = float(os.getenv("PROFILE_SLOW_CYCLE_SECONDS", "0"))
+    PROFILE_SLOW_TARGETS: int = int(os.getenv("PROFILE_SLOW_TARGETS", "20"))
 
     # Steam параметры по умолчанию
     DEFAULT_APPID: int = 730  # CS2
     DEFAULT_CONTEXTID: int = 2
 
+    # Доставка уведомлений: у Telegram ~30 сообщений/с на бота и ~1/с в один чат
+    TELEGRAM_MESSAGES_PER_SECOND: float = float(os.getenv("TELEGRAM_MESSAGES_PER_SECOND", "25"))
+    TELEGRAM_RATE_BURST: int = int(os.getenv("TELEGRAM_RATE_BURST", "5"))
+    TELEGRAM_CHAT_INTERVAL: float = float(os.getenv("TELEGRAM_CHAT_INTERVAL", "1"))
+    NOTIFY_QUEUE_SIZE: int = int(os.getenv("NOTIFY_QUEUE_SIZE", "10000"))
+    NOTIFY_WORKERS: int = int(os.getenv("NOTIFY_WORKERS", "8"))
+    NOTIFY_DRAIN_SECONDS: float = float(os.getenv("NOTIFY_DRAIN_SECONDS", "5"))
+
+    # Незавершённые диалоги (/add до выбора игры): memory или sqlite (переживает рестарт)
+    STATE_BACKEND: str = os.getenv("STATE_BACKEND", "memory")
+    STATE_TTL_SECONDS: float = float(os.getenv("STATE_TTL_SECONDS", "1800"))
+    STATE_MAX_ENTRIES: int = int(os.getenv("STATE_MAX_ENTRIES", "10000"))
+
+    # Массовый импорт (/import): размер списка, параллельный засев и частота обновления статуса
+    IMPORT_MAX_TARGETS: int = int(os.getenv("IMPORT_MAX_TARGETS", "1000"))
+    IMPORT_MAX_FILE_BYTES: int = int(os.getenv("IMPORT_MAX_FILE_BYTES", "1000000"))
+    IMPORT_CONCURRENCY: int = int(os.getenv("IMPORT_CONCURRENCY", "4"))
+    IMPORT_PROGRESS_SECONDS: float = float(os.getenv("IMPORT_PROGRESS_SECONDS", "3"))
+
     # Лимиты
     MAX_ITEMS_PER_NOTIFICATION: int = 10
+    # Уведомлять ли о предметах, ушедших из инвентаря (трейд, продажа)
+    NOTIFY_REMOVED_ITEMS: bool = os.getenv("NOTIFY_REMOVED_ITEMS", "0") == "1"
+    # Считать пару «ушёл + пришёл» с одним classid переездом предмета, а не новым предметом.
+    # У кейсов, ключей, стикеров classid общий — с флагом новый такой предмет не попадёт в уведомления
+    DETECT_MOVED_ITEMS: bool = os.getenv("DETECT_MOVED_ITEMS", "0") == "1"
     MAX_RETRY_ATTEMPTS: int = 3
+    # Декодер ответов Steam: auto (msgspec -> orjson -> json), msgspec, orjson, json
+    JSON_DECODER: str = os.getenv("JSON_DECODER", "auto")
+    # Размер общего LRU-кеша названий предметов (0 — выключен)
+    ITEM_NAME_CACHE_SIZE: int = int(os.getenv("ITEM_NAME_CACHE_SIZE", "50000"))
 
     @classmethod
     def validate(cls):
-        if not cls.BOT_TOKEN:
+        if cls.DB_SYNCHRONOUS.upper() not in ("OFF", "NORMAL", "FULL", "EXTRA"):
+            raise ValueError(f"❌ Неизвестный режим DB_SYNCHRONOUS={cls.DB_SYNCHRONOUS}")
+        if cls.STATE_BACKEND not in ("memory", "sqlite"):
+            raise ValueError(f"❌ Неизвестное хранилище STATE_BACKEND={cls.STATE_BACKEND} (memory, sqlite)")
+        if cls.ROLE not in ("all", "bot", "worker"):
+            raise ValueError(f"❌ Неизвестная роль ROLE={cls.ROLE} (all, bot, worker)")
+        if cls.BOT_MODE not in ("polling", "webhook"):
+            raise ValueError(f"❌ Неизвестный режим BOT_MODE={cls.BOT_MODE} (polling, webhook)")
+        if cls.BOT_MODE == "webhook" and cls.ROLE != "worker":
+            if not cls.WEBHOOK_URL:
+                raise ValueError("❌ Для BOT_MODE=webhook нужен WEBHOOK_URL")
+            if not re.fullmatch(r"[A-Za-z0-9_-]{1,256}", cls.WEBHOOK_SECRET):
+                raise ValueError("❌ Для BOT_MODE=webhook нужен WEBHOOK_SECRET: 1-256 символов A-Z, a-z, 0-9, _ и -")
+        # Воркеру Telegram не нужен
+        if not cls.BOT_TOKEN and cls.ROLE != "worker":
             raise ValueError("❌ BOT_TOKEN не указан в .env файле!")
         # Создаём директорию для БД если нет
         db_path = Path(cls.DATABASE_PATH)
@@ -1,20 +1,68 @@
+import asyncio
 import aiosqlite
 from typing import Optional
+import metrics
 from config import config
 
 class Database:
     def __init__(self, db_path: str):
         self.db_path = db_path
+        # Пишущее соединение одно на всех: транзакции разных корутин не должны перемешиваться
         self._connection: Optional[aiosqlite.Connection] = None
+        self._write_lock = asyncio.Lock()
+        # Читающие соединения: в WAL чтения бота не ждут запись снапшотов
+        self._readers: list[aiosqlite.Connection] = []
+        self._next_reader = 0
+        # Индекс подписок в памяти: (steamid64, appid) -> tg_user_id, чтобы не ходить в SQL на горячем пути
+        self._subscribers: dict[tuple[str, int], set[int]] = {}
+        self._user_targets: dict[int, dict[tuple[str, int], int]] = {}
 
     async def connect(self):
-        self._connection = await aiosqlite.connect(self.db_path)
+        self._connection = await self._open_connection()
+        # Освобождённые страницы возвращаются ОС порциями (PRAGMA incremental_vacuum).
+        # Новой БД режим задаётся до первой таблицы; существующую переводит полный VACUUM —
+        # при миграции снапшотов или в обслуживании (ensure_incremental_vacuum), не при старте
+        await self._connection.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        # WAL сохраняется в файле БД: читатели и другие процессы не блокируются записью
+        await self._connection.execute("PRAGMA journal_mode = WAL")
         await self._init_tables()
 
+        for _ in range(config.DB_READ_CONNECTIONS):
+            reader = await self._open_connection()
+            await reader.execute("PRAGMA query_only = 1")
+            self._readers.append(reader)
+
+        await self._load_subscriptions()
+
+    async def _open_connection(self) -> aiosqlite.Connection:
+        # Таймаут нужен, когда в одну БД пишут несколько процессов-воркеров
+        connection = await aiosqlite.connect(
+            self.db_path,
+            timeout=config.DB_BUSY_TIMEOUT,
+            cached_statements=config.DB_STATEMENT_CACHE
+        )
+        await connection.execute(f"PRAGMA synchronous = {config.DB_SYNCHRONOUS.upper()}")
+        await connection.execute(f"PRAGMA cache_size = {-config.DB_CACHE_SIZE_KB}")
+        await connection.execute(f"PRAGMA mmap_size = {config.DB_MMAP_SIZE}")
+        return connection
+
     async def close(self):
+        for reader in self._readers:
+            await reader.close()
+        self._readers.clear()
         if self._connection:
             await self._connection.close()
 
+    def _reader(self) -> aiosqlite.Connection:
+        """Читающее соединение по кругу (или пишущее, если пул выключен).
+
+        Запросы к одному соединению aiosqlite и так выполняет по очереди в своём потоке,
+        поэтому соединение не занимается целиком — достаточно разнести нагрузку."""
+        if not self._readers:
+            return self._connection
+        self._next_reader = (self._next_reader + 1) % len(self._readers)
+        return self._readers[self._next_reader]
+
     async def _init_tables(self):
         # Исправлено: DEFAULT значения прописаны напрямую, не через ?
         await self._connection.execute(f"""
@@ -29,56 +77,237 @@ class Database:
             )
         """)
 
-        await self._connection.execute(f"""
-            CREATE TABLE IF NOT EXISTS inventory_snapshots (
+        # Снапшот: 64-битный ключ предмета, кластеризованный по (steamid64, appid)
+        await self._connection.execute("""
+            CREATE TABLE IF NOT EXISTS inventory_items (
+                steamid64 INTEGER NOT NULL,
+                appid INTEGER NOT NULL,
+                item_key INTEGER NOT NULL,
+                classid INTEGER,
+                PRIMARY KEY (steamid64, appid, item_key)
+            ) WITHOUT ROWID
+        """)
+
+        # Отпечаток инвентаря: позволяет пропустить неизменившиеся инвентари без чтения снапшота
+        await self._connection.execute("""
+            CREATE TABLE IF NOT EXISTS inventory_fingerprints (
+                steamid64 TEXT NOT NULL,
+                appid INTEGER NOT NULL,
+                total_count INTEGER NOT NULL,
+                digest TEXT NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (steamid64, appid)
+            )
+        """)
+
+        # Состояние опроса по каждой цели: переживает рестарт, проверка продолжается с места остановки
+        await self._connection.execute("""
+            CREATE TABLE IF NOT EXISTS target_state (
+                steamid64 TEXT NOT NULL,
+                appid INTEGER NOT NULL,
+                next_check_at REAL NOT NULL,
+                check_interval REAL NOT NULL,
+                failures INTEGER NOT NULL DEFAULT 0,
+                last_checked_at REAL,
+                last_result TEXT,
+                last_error TEXT,
+                PRIMARY KEY (steamid64, appid)
+            )
+        """)
+
+        # Аренды воркеров: по живым арендам строится кольцо шардов
+        await self._connection.execute("""
+            CREATE TABLE IF NOT EXISTS worker_leases (
+                worker_id TEXT PRIMARY KEY,
+                expires_at REAL NOT NULL,
+                proxy TEXT
+            )
+        """)
+
+        # Уведомления от воркеров для процесса бота
+        await self._connection.execute("""
+            CREATE TABLE IF NOT EXISTS notification_outbox (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
+                tg_user_id BIGINT NOT NULL,
+                kind TEXT NOT NULL,
                 steamid64 TEXT NOT NULL,
-                appid INTEGER DEFAULT {config.DEFAULT_APPID},
-                item_hash TEXT NOT NULL,
-                detected_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE(steamid64, appid, item_hash)
+                appid INTEGER NOT NULL,
+                items TEXT NOT NULL
+            )
+        """)
+
+        # Незавершённые диалоги бота (STATE_BACKEND=sqlite)
+        await self._connection.execute("""
+            CREATE TABLE IF NOT EXISTS conversation_state (
+                key INTEGER PRIMARY KEY,
+                value TEXT NOT NULL,
+                expires_at REAL NOT NULL
             )
         """)
 
         await self._connection.execute(
             "CREATE INDEX IF NOT EXISTS idx_tracked_steamid ON tracked_users(steamid64, appid)"
         )
-        await self._connection.execute(
-            "CREATE INDEX IF NOT EXISTS idx_snapshot_steamid ON inventory_snapshots(steamid64, appid)"
-        )
         await self._connection.commit()
 
+        await self._migrate_snapshots()
+
+        # classid появился позже: нужен для поиска переехавших предметов
+        async with self._connection.execute("PRAGMA table_info(inventory_items)") as cursor:
+            columns = {row[1] for row in await cursor.fetchall()}
+        if "classid" not in columns:
+            await self._connection.execute("ALTER TABLE inventory_items ADD COLUMN classid INTEGER")
+            # Без отпечатков следующая проверка каждой цели сравнит инвентарь целиком
+            # и заполнит classid у уже сохранённых предметов
+            await self._connection.execute("DELETE FROM inventory_fingerprints")
+            await self._connection.commit()
+
+    async def _migrate_snapshots(self):
+        """Переносит старую таблицу inventory_snapshots (hex MD5 в TEXT) в inventory_items"""
+        async with self._connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'inventory_snapshots'"
+        ) as cursor:
+            if not await cursor.fetchone():
+                return
+
+        print("🔄 Миграция inventory_snapshots -> inventory_items...")
+        async with self._write_lock:
+            try:
+                await self._connection.execute("BEGIN IMMEDIATE")
+                async with self._connection.execute(
+                    "SELECT steamid64, appid, item_hash FROM inventory_snapshots"
+                ) as cursor:
+                    while rows := await cursor.fetchmany(10_000):
+                        # Первые 8 байт MD5 — тот же ключ, что теперь считает steam_api.item_hash
+                        await self._connection.executemany(
+                            "INSERT OR IGNORE INTO inventory_items (steamid64, appid, item_key) VALUES (?, ?, ?)",
+                            [
+                                (int(steamid64), appid,
+                                 int.from_bytes(bytes.fromhex(h[:16]), "big", signed=True))
+                                for steamid64, appid, h in rows
+                            ]
+                        )
+                await self._connection.execute("DROP TABLE inventory_snapshots")
+                await self._connection.commit()
+            except Exception:
+                await self._connection.rollback()
+                raise
+
+        # Освобождаем страницы старой таблицы; тот же VACUUM включает incremental auto_vacuum
+        await self._connection.execute("VACUUM")
+        print("✅ Миграция снапшотов завершена")
+
+    async def _load_subscriptions(self):
+        self._subscribers.clear()
+        self._user_targets.clear()
+        async with self._reader().execute(
+            "SELECT tg_user_id, steamid64, appid, contextid FROM tracked_users"
+        ) as cursor:
+            async for tg_user_id, steamid64, appid, contextid in cursor:
+                self._index_add(tg_user_id, steamid64, appid, contextid)
+
+    def _index_add(self, tg_user_id: int, steamid64: str, appid: int, contextid: int):
+        self._subscribers.setdefault((steamid64, appid), set()).add(tg_user_id)
+        self._user_targets.setdefault(tg_user_id, {})[(steamid64, appid)] = contextid
+
+    def _index_remove(self, tg_user_id: int, steamid64: str, appid: int):
+        users = self._subscribers.get((steamid64, appid))
+        if users is not None:
+            users.discard(tg_user_id)
+            if not users:
+                del self._subscribers[(steamid64, appid)]
+        targets = self._user_targets.get(tg_user_id)
+        if targets is not None:
+            targets.pop((steamid64, appid), None)
+            if not targets:
+                del self._user_targets[tg_user_id]
+
+    async def reload_subscriptions(self):
+        """Перечитывает индекс подписок: нужно воркерам, подписки меняет процесс бота"""
+        await self._load_subscriptions()
+
+    def get_targets(self) -> list[tuple[str, int]]:
+        """Все отслеживаемые инвентари (steamid64, appid) без дубликатов"""
+        return list(self._subscribers)
+
+    def get_subscribers(self, steamid64: str, appid: int) -> set[int]:
+        return set(self._subscribers.get((steamid64, appid), ()))
+
+    def get_user_tracks(self, tg_user_id: int) -> list[tuple]:
+        """То же, что get_tracked_users(tg_user_id=...), но из индекса"""
+        return [
+            (tg_user_id, steamid64, appid, contextid)
+            for (steamid64, appid), contextid in self._user_targets.get(tg_user_id, {}).items()
+        ]
+
     async def add_tracked_user(self, tg_user_id: int, steamid64: str,
                               appid: int = None, contextid: int = None) -> bool:
         appid = appid or config.DEFAULT_APPID
         contextid = contextid or config.DEFAULT_CONTEXTID
         try:
-            await self._connection.execute(
-                """INSERT OR IGNORE INTO tracked_users 
-                   (tg_user_id, steamid64, appid, contextid) 
-                   VALUES (?, ?, ?, ?)""",
-                (tg_user_id, steamid64, appid, contextid)
-            )
-            await self._connection.commit()
+            async with self._write_lock:
+                await self._connection.execute(
+                    """INSERT OR IGNORE INTO tracked_users 
+                       (tg_user_id, steamid64, appid, contextid) 
+                       VALUES (?, ?, ?, ?)""",
+                    (tg_user_id, steamid64, appid, contextid)
+                )
+                await self._connection.commit()
+            if (steamid64, appid) not in self._user_targets.get(tg_user_id, {}):
+                self._index_add(tg_user_id, steamid64, appid, contextid)
             return True
         except Exception as e:
             print(f"DB Error (add_tracked_user): {e}")
             return False
 
+    async def add_tracked_users(self, tg_user_id: int,
+                                targets: list[tuple[str, int]]) -> list[tuple[str, int]]:
+        """Добавляет пачку целей одной транзакцией; возвращает те, что раньше не отслеживались"""
+        known = self._user_targets.get(tg_user_id, {})
+        new = [target for target in dict.fromkeys(targets) if target not in known]
+        if not new:
+            return []
+        async with self._write_lock, metrics.DB_WRITE_SECONDS.labels("tracked_users").time():
+            try:
+                await self._connection.execute("BEGIN IMMEDIATE")
+                await self._connection.executemany(
+                    """INSERT OR IGNORE INTO tracked_users (tg_user_id, steamid64, appid, contextid)
+                       VALUES (?, ?, ?, ?)""",
+                    ((tg_user_id, steamid64, appid, config.DEFAULT_CONTEXTID) for steamid64, appid in new)
+                )
+                await self._connection.commit()
+            except Exception:
+                await self._connection.rollback()
+                raise
+        for steamid64, appid in new:
+            self._index_add(tg_user_id, steamid64, appid, config.DEFAULT_CONTEXTID)
+        return new
+
     async def remove_tracked_user(self, tg_user_id: int, steamid64: str,
                                  appid: int = None) -> bool:
         appid = appid or config.DEFAULT_APPID
         try:
-            await self._connection.execute(
-                "DELETE FROM tracked_users WHERE tg_user_id = ? AND steamid64 = ? AND appid = ?",
-                (tg_user_id, steamid64, appid)
-            )
-            await self._connection.commit()
-            return True
+            async with self._write_lock:
+                await self._connection.execute(
+                    "DELETE FROM tracked_users WHERE tg_user_id = ? AND steamid64 = ? AND appid = ?",
+                    (tg_user_id, steamid64, appid)
+                )
+                await self._connection.commit()
+            self._index_remove(tg_user_id, steamid64, appid)
         except Exception as e:
             print(f"DB Error (remove_tracked_user): {e}")
             return False
 
+        if not self._subscribers.get((steamid64, appid)):
+            # Последний подписчик ушёл — снапшот больше не нужен
+            try:
+                await self.prune_target(steamid64, appid)
+            except Exception as e:
+                print(f"DB Error (prune_target): {e}")
+        return True
+
     async def get_tracked_users(self, tg_user_id: Optional[int] = None,
                                steamid64: Optional[str] = None):
         query = "SELECT tg_user_id, steamid64, appid, contextid FROM tracked_users WHERE 1=1"
@@ -90,30 +319,292 @@ class Database:
             query += " AND steamid64 = ?"
             params.append(steamid64)
 
-        async with self._connection.execute(query, params) as cursor:
+        async with self._reader().execute(query, params) as cursor:
             return await cursor.fetchall()
 
-    async def get_item_hashes(self, steamid64: str, appid: int) -> set[str]:
-        async with self._connection.execute(
-            "SELECT item_hash FROM inventory_snapshots WHERE steamid64 = ? AND appid = ?",
+    async def get_snapshot(self, steamid64: str, appid: int) -> dict[int, Optional[int]]:
+        """Текущий снапшот инвентаря: ключ предмета -> classid"""
+        async with self._reader().execute(
+            "SELECT item_key, classid FROM inventory_items WHERE steamid64 = ? AND appid = ?",
+            (int(steamid64), appid)
+        ) as cursor:
+            return {key: classid for key, classid in await cursor.fetchall()}
+
+    async def apply_snapshot_diff(self, steamid64: str, appid: int,
+                                  added: dict[int, Optional[int]], removed: set[int],
+                                  backfill: Optional[dict[int, int]] = None) -> set[int]:
+        """Применяет к снапшоту только дельту одной транзакцией и возвращает реально вставленные ключи.
+        backfill — classid для предметов, сохранённых до появления колонки"""
+        if not added and not removed and not backfill:
+            return set()
+
+        steamid = int(steamid64)
+        inserted = set()
+        async with self._write_lock, metrics.DB_WRITE_SECONDS.labels("snapshot").time():
+            try:
+                # IMMEDIATE: блокировку записи берём сразу и ждём её DB_BUSY_TIMEOUT. Отложенная
+                # транзакция, начавшая с чтения, падала бы «database is locked» без ожидания,
+                # если между чтением и записью успел закоммитить другой процесс
+                await self._connection.execute("BEGIN IMMEDIATE")
+                if added:
+                    # Вставляем пачкой во временную таблицу и сливаем через join по первичному ключу
+                    await self._connection.execute(
+                        """CREATE TEMP TABLE IF NOT EXISTS incoming_items
+                           (item_key INTEGER PRIMARY KEY, classid INTEGER)"""
+                    )
+                    await self._connection.executemany(
+                        "INSERT OR IGNORE INTO incoming_items (item_key, classid) VALUES (?, ?)",
+                        added.items()
+                    )
+                    async with self._connection.execute(
+                        """SELECT i.item_key, i.classid FROM incoming_items i
+                           WHERE NOT EXISTS (
+                               SELECT 1 FROM inventory_items s
+                               WHERE s.steamid64 = ? AND s.appid = ? AND s.item_key = i.item_key
+                           )""",
+                        (steamid, appid)
+                    ) as cursor:
+                        new_rows = await cursor.fetchall()
+
+                    await self._connection.executemany(
+                        """INSERT OR IGNORE INTO inventory_items (steamid64, appid, item_key, classid)
+                           VALUES (?, ?, ?, ?)""",
+                        ((steamid, appid, key, classid) for key, classid in new_rows)
+                    )
+                    await self._connection.execute("DELETE FROM incoming_items")
+                    inserted = {key for key, _ in new_rows}
+
+                if removed:
+                    await self._connection.executemany(
+                        "DELETE FROM inventory_items WHERE steamid64 = ? AND appid = ? AND item_key = ?",
+                        ((steamid, appid, key) for key in removed)
+                    )
+                if backfill:
+                    await self._connection.executemany(
+                        """UPDATE inventory_items SET classid = ?
+                           WHERE steamid64 = ? AND appid = ? AND item_key = ? AND classid IS NULL""",
+                        ((classid, steamid, appid, key) for key, classid in backfill.items())
+                    )
+                await self._connection.commit()
+            except Exception:
+                await self._connection.rollback()
+                raise
+
+        return inserted
+
+    async def get_fingerprint(self, steamid64: str, appid: int):
+        async with self._reader().execute(
+            """SELECT total_count, digest, etag, last_modified
+               FROM inventory_fingerprints WHERE steamid64 = ? AND appid = ?""",
             (steamid64, appid)
         ) as cursor:
-            return {row[0] for row in await cursor.fetchall()}
+            return await cursor.fetchone()
 
-    async def save_item_hashes(self, steamid64: str, appid: int, hashes: set[str]):
-        for h in hashes:
+    async def save_fingerprint(self, steamid64: str, appid: int, total_count: int, digest: str,
+                               etag: Optional[str] = None, last_modified: Optional[str] = None):
+        async with self._write_lock, metrics.DB_WRITE_SECONDS.labels("fingerprint").time():
             await self._connection.execute(
-                "INSERT OR IGNORE INTO inventory_snapshots (steamid64, appid, item_hash) VALUES (?, ?, ?)",
-                (steamid64, appid, h)
+                """INSERT OR REPLACE INTO inventory_fingerprints
+                   (steamid64, appid, total_count, digest, etag, last_modified)
+                   VALUES (?, ?, ?, ?, ?, ?)""",
+                (steamid64, appid, total_count, digest, etag, last_modified)
             )
-        await self._connection.commit()
+            await self._connection.commit()
 
-    async def cleanup_old_snapshots(self, days: int = 30):
-        await self._connection.execute("""
-            DELETE FROM inventory_snapshots 
-            WHERE steamid64 NOT IN (SELECT DISTINCT steamid64 FROM tracked_users)
-            OR detected_at < datetime('now', ?)
-        """, (f"-{days} days",))
-        await self._connection.commit()
+    async def get_target_states(self):
+        async with self._reader().execute(
+            "SELECT steamid64, appid, next_check_at, check_interval, failures FROM target_state"
+        ) as cursor:
+            return await cursor.fetchall()
+
+    async def save_target_states(self, states: list[tuple]):
+        """states: (steamid64, appid, next_check_at, check_interval, failures,
+        last_checked_at, last_result, last_error)"""
+        if not states:
+            return
+        async with self._write_lock, metrics.DB_WRITE_SECONDS.labels("target_state").time():
+            await self._connection.executemany(
+                """INSERT OR REPLACE INTO target_state
+                   (steamid64, appid, next_check_at, check_interval, failures,
+                    last_checked_at, last_result, last_error)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                states
+            )
+            await self._connection.commit()
+
+    async def renew_worker_lease(self, worker_id: str, expires_at: float, proxy: Optional[str] = None):
+        async with self._write_lock:
+            await self._connection.execute(
+                "INSERT OR REPLACE INTO worker_leases (worker_id, expires_at, proxy) VALUES (?, ?, ?)",
+                (worker_id, expires_at, proxy)
+            )
+            await self._connection.commit()
+
+    async def release_worker_lease(self, worker_id: str):
+        async with self._write_lock:
+            await self._connection.execute("DELETE FROM worker_leases WHERE worker_id = ?", (worker_id,))
+            await self._connection.commit()
+
+    async def get_live_workers(self, now: float) -> list[str]:
+        async with self._reader().execute(
+            "SELECT worker_id FROM worker_leases WHERE expires_at > ? ORDER BY worker_id", (now,)
+        ) as cursor:
+            return [row[0] for row in await cursor.fetchall()]
+
+    async def add_outbox_notifications(self, rows: list[tuple[int, str, str, int, str]]):
+        """Кладёт уведомления (tg_user_id, kind, steamid64, appid, items) одной транзакцией"""
+        if not rows:
+            return
+        async with self._write_lock, metrics.DB_WRITE_SECONDS.labels("outbox").time():
+            try:
+                await self._connection.execute("BEGIN IMMEDIATE")
+                await self._connection.executemany(
+                    """INSERT INTO notification_outbox (tg_user_id, kind, steamid64, appid, items)
+                       VALUES (?, ?, ?, ?, ?)""",
+                    rows
+                )
+                await self._connection.commit()
+            except Exception:
+                await self._connection.rollback()
+                raise
+
+    async def take_outbox_notifications(self, limit: int = 500):
+        """Забирает пачку уведомлений из outbox (и сразу удаляет их)"""
+        async with self._write_lock:
+            try:
+                await self._connection.execute("BEGIN IMMEDIATE")
+                async with self._connection.execute(
+                    """SELECT id, tg_user_id, kind, steamid64, appid, items
+                       FROM notification_outbox ORDER BY id LIMIT ?""",
+                    (limit,)
+                ) as cursor:
+                    rows = await cursor.fetchall()
+                if rows:
+                    await self._connection.execute(
+                        "DELETE FROM notification_outbox WHERE id <= ?", (rows[-1][0],)
+                    )
+                await self._connection.commit()
+            except Exception:
+                await self._connection.rollback()
+                raise
+        return [row[1:] for row in rows]
+
+    async def get_conversation_state(self, key: int, now: float) -> Optional[str]:
+        async with self._reader().execute(
+            "SELECT value FROM conversation_state WHERE key = ? AND expires_at > ?", (key, now)
+        ) as cursor:
+            row = await cursor.fetchone()
+        return row[0] if row else None
+
+    async def set_conversation_state(self, key: int, value: str, expires_at: float):
+        async with self._write_lock:
+            await self._connection.execute(
+                "INSERT OR REPLACE INTO conversation_state (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, expires_at)
+            )
+            await self._connection.commit()
+
+    async def delete_conversation_state(self, key: int):
+        async with self._write_lock:
+            await self._connection.execute("DELETE FROM conversation_state WHERE key = ?", (key,))
+            await self._connection.commit()
+
+    async def purge_conversation_states(self, now: float, maxsize: int):
+        """Удаляет истёкшие состояния и самые старые сверх maxsize"""
+        async with self._write_lock:
+            await self._connection.execute("DELETE FROM conversation_state WHERE expires_at <= ?", (now,))
+            await self._connection.execute(
+                """DELETE FROM conversation_state WHERE key IN (
+                       SELECT key FROM conversation_state ORDER BY expires_at DESC LIMIT -1 OFFSET ?
+                   )""",
+                (maxsize,)
+            )
+            await self._connection.commit()
+
+    async def prune_target(self, steamid64: str, appid: int) -> int:
+        """Удаляет снапшот, отпечаток и состояние опроса цели порциями по DB_GC_CHUNK строк.
+
+        Между порциями блокировка записи отпускается, чтобы не задерживать проверки;
+        если цель снова начали отслеживать, чистка прекращается."""
+        steamid = int(steamid64)
+        deleted = 0
+        while True:
+            async with self._write_lock, metrics.DB_WRITE_SECONDS.labels("gc").time():
+                try:
+                    await self._connection.execute("BEGIN IMMEDIATE")
+                    async with self._connection.execute(
+                        "SELECT 1 FROM tracked_users WHERE steamid64 = ? AND appid = ? LIMIT 1",
+                        (steamid64, appid)
+                    ) as cursor:
+                        if await cursor.fetchone():
+                            await self._connection.rollback()
+                            return deleted
+
+                    cursor = await self._connection.execute(
+                        """DELETE FROM inventory_items
+                           WHERE steamid64 = ? AND appid = ? AND item_key IN (
+                               SELECT item_key FROM inventory_items
+                               WHERE steamid64 = ? AND appid = ? LIMIT ?
+                           )""",
+                        (steamid, appid, steamid, appid, config.DB_GC_CHUNK)
+                    )
+                    chunk = cursor.rowcount
+                    await cursor.close()
+                    deleted += chunk
+
+                    if chunk < config.DB_GC_CHUNK:
+                        await self._connection.execute(
+                            "DELETE FROM inventory_fingerprints WHERE steamid64 = ? AND appid = ?",
+                            (steamid64, appid)
+                        )
+                        await self._connection.execute(
+                            "DELETE FROM target_state WHERE steamid64 = ? AND appid = ?",
+                            (steamid64, appid)
+                        )
+                        await self._connection.commit()
+                        return deleted
+                    await self._connection.commit()
+                except Exception:
+                    await self._connection.rollback()
+                    raise
+            await asyncio.sleep(0)
+
+    async def cleanup_old_snapshots(self) -> int:
+        """Удаляет снапшоты, отпечатки и состояние опроса инвентарей, которые больше никто не отслеживает"""
+        async with self._reader().execute("SELECT DISTINCT steamid64, appid FROM tracked_users") as cursor:
+            tracked = {(int(steamid64), appid) for steamid64, appid in await cursor.fetchall()}
+
+        # Ищем на читающем соединении: запись в это время не блокируется
+        stored = set()
+        for query in ("SELECT DISTINCT steamid64, appid FROM inventory_items",
+                      "SELECT steamid64, appid FROM inventory_fingerprints",
+                      "SELECT steamid64, appid FROM target_state"):
+            async with self._reader().execute(query) as cursor:
+                stored.update((int(steamid64), appid) for steamid64, appid in await cursor.fetchall())
+
+        deleted = 0
+        for steamid, appid in stored - tracked:
+            deleted += await self.prune_target(str(steamid), appid)
+        return deleted
+
+    async def ensure_incremental_vacuum(self) -> bool:
+        """Переводит старую БД в auto_vacuum=INCREMENTAL полным VACUUM — один раз за жизнь файла.
+        True, если перевод был сейчас"""
+        async with self._connection.execute("PRAGMA auto_vacuum") as cursor:
+            mode, = await cursor.fetchone()
+        if mode == 2:
+            return False
+        async with self._write_lock:
+            await self._connection.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            await self._connection.execute("VACUUM")
+        return True
+
+    async def optimize(self):
+        """Обновляет статистику планировщика запросов и возвращает ОС часть свободных страниц"""
+        async with self._write_lock:
+            await self._connection.execute("PRAGMA optimize")
+            # incremental_vacuum освобождает по странице за шаг, а execute делает только один —
+            # executescript проходит оператор до конца
+            await self._connection.executescript(f"PRAGMA incremental_vacuum({config.DB_VACUUM_PAGES});")
 
 db = Database(config.DATABASE_PATH)
\ No newline at end of file
@@ -0,0 +1,121 @@
+import asyncio
+import logging
+import re
+import time
+from aiogram import types
+from config import config
+from database import db
+from steam_api import SteamInventoryFetcher
+
+logger = logging.getLogger(__name__)
+
+# SteamID64 всегда начинается с 7656119 — находим его и в ссылке, и отдельным числом
+STEAMID_PATTERN = re.compile(r'(?<!\d)(7656119\d{10})(?!\d)')
+# AppID после SteamID: .../inventory/#730_2, .../inventory/730 или через пробел/запятую
+APPID_PATTERN = re.compile(r'^(?:/?inventory/#?|/?#|[\s,;]+)(\d{1,7})(?!\d)')
+
+
+def parse_watchlist(text: str) -> tuple[list[tuple[str, int]], list[str]]:
+    """Разбирает список целей, по одной на строку; возвращает (цели без дубликатов, нераспознанные строки)"""
+    targets, invalid = [], []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        match = STEAMID_PATTERN.search(line)
+        if not match:
+            invalid.append(line)
+            continue
+        appid = APPID_PATTERN.match(line[match.end():])
+        targets.append((match.group(1), int(appid.group(1)) if appid else config.DEFAULT_APPID))
+    return list(dict.fromkeys(targets)), invalid
+
+
+class WatchlistImport:
+    """Засевает снапшоты импортированных целей в фоне и показывает прогресс в одном сообщении"""
+
+    def __init__(self, fetcher: SteamInventoryFetcher, status: types.Message,
+                 targets: list[tuple[str, int]], already_tracked: int, invalid: list[str]):
+        self.fetcher = fetcher
+        self.status = status
+        self.targets = targets
+        self.already_tracked = already_tracked
+        self.invalid = invalid
+        self.seeded = 0
+        # Снапшот уже есть — цель отслеживает кто-то ещё
+        self.skipped = 0
+        self.failed: list[tuple[str, int, str]] = []
+        self._last_text = ""
+
+    @property
+    def done(self) -> int:
+        return self.seeded + self.skipped + len(self.failed)
+
+    async def run(self):
+        started = time.monotonic()
+        queue: asyncio.Queue = asyncio.Queue()
+        for target in self.targets:
+            queue.put_nowait(target)
+
+        # Темп запросов к Steam задаёт пул прокси, здесь — только число одновременных засевов
+        workers = [
+            asyncio.create_task(self._worker(queue))
+            for _ in range(min(config.IMPORT_CONCURRENCY, len(self.targets)))
+        ]
+        reporter = asyncio.create_task(self._report_progress())
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            reporter.cancel()
+            await self._edit(self._text(finished=True))
+        logger.info(f"📥 Импорт {len(self.targets)} целей завершён за {time.monotonic() - started:.0f}с")
+
+    async def _worker(self, queue: asyncio.Queue):
+        while True:
+            try:
+                steamid64, appid = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                if await db.get_fingerprint(steamid64, appid) is not None:
+                    self.skipped += 1
+                    continue
+                await self.fetcher.get_inventory_diff(steamid64, appid)
+                self.seeded += 1
+            except Exception as e:
+                # Приватный инвентарь и т.п.: цель остаётся в списке, её досеет планировщик
+                self.failed.append((steamid64, appid, str(e)))
+
+    async def _report_progress(self):
+        while True:
+            await asyncio.sleep(config.IMPORT_PROGRESS_SECONDS)
+            await self._edit(self._text())
+
+    def _text(self, finished: bool = False) -> str:
+        lines = [
+            "✅ Импорт завершён" if finished else f"📥 Импорт: {self.done}/{len(self.targets)}",
+            f"➕ Добавлено целей: {len(self.targets)}",
+        ]
+        if self.already_tracked:
+            lines.append(f"↩️ Уже отслеживались: {self.already_tracked}")
+        if self.invalid:
+            lines.append(f"❓ Нераспознанных строк: {len(self.invalid)}")
+        lines.append(f"🌱 Снапшотов засеяно: {self.seeded + self.skipped}")
+        if self.failed:
+            lines.append(f"⚠️ Не удалось получить инвентарь: {len(self.failed)}")
+        if finished:
+            for steamid64, appid, error in self.failed[:10]:
+                lines.append(f"   • {steamid64}/{appid}: {error}")
+            for line in self.invalid[:5]:
+                lines.append(f"   • ? {line[:60]}")
+        return "\n".join(lines)
+
+    async def _edit(self, text: str):
+        # Редактируем одно сообщение и только если текст изменился
+        if text == self._last_text:
+            return
+        try:
+            await self.status.edit_text(text)
+            self._last_text = text
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось обновить статус импорта: {e}")
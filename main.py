@@ -1,10 +1,16 @@
 import asyncio
 import logging
 from aiogram import Bot, Dispatcher
+import metrics
 from config import config
 from database import db
+from proxy_pool import ProxyPool
+from steam_api import SteamInventoryFetcher
 from telegram_bot import InventoryBot
 from scheduler import InventoryChecker
+from notifier import NotificationDispatcher, OutboxNotifier, OutboxRelay
+from sharding import ShardCoordinator
+from webhook import WebhookServer
 
 
 logging.basicConfig(
@@ -18,24 +24,53 @@ async def main():
     # Валидация конфига
     config.validate()
 
-    # Инициализация
-    bot = Bot(token=config.BOT_TOKEN)
-    dp = Dispatcher()
-
     # Подключение к БД
     await db.connect()
     logger.info("✅ Подключено к базе данных")
 
+    if config.ROLE == "worker":
+        await run_worker()
+    else:
+        await run_bot()
+
+
+async def run_bot():
+    """ROLE=all — бот и опрос в одном процессе; ROLE=bot — только Telegram и доставка.
+    Обновления Telegram — long polling или вебхук (BOT_MODE)"""
+    bot = Bot(token=config.BOT_TOKEN)
+    dp = Dispatcher()
+
+    # Один HTTP-клиент Steam и пул прокси на всё приложение: их делят бот (/add) и планировщик
+    fetcher = SteamInventoryFetcher(ProxyPool.from_config())
+    await fetcher.open()
+
     # Бот
-    bot_wrapper = InventoryBot(bot, dp)
+    bot_wrapper = InventoryBot(bot, dp, fetcher)
+
+    # Уведомления доставляются отдельно от опроса Steam
+    notifier = NotificationDispatcher(bot_wrapper)
+
+    # Планировщик — только в монолитном режиме; в режиме bot уведомления приходят от воркеров
+    checker = InventoryChecker(notifier, fetcher) if config.ROLE == "all" else None
+    relay = OutboxRelay(notifier) if config.ROLE == "bot" else None
 
-    # Планировщик
-    checker = InventoryChecker(bot_wrapper)
+    # В режиме webhook /metrics отдаёт сервер вебхука
+    webhook = WebhookServer(bot, dp) if config.BOT_MODE == "webhook" else None
+    metrics_server = await metrics.start_server() if not webhook else None
 
     # Graceful shutdown
     async def on_shutdown():
         logger.info("🔄 Завершение работы...")
-        await checker.stop()
+        if metrics_server:
+            await metrics_server.cleanup()
+        if webhook:
+            await webhook.stop()
+        if checker:
+            await checker.stop()
+        if relay:
+            await relay.stop()
+        await notifier.stop()
+        await fetcher.close()
         await db.close()
         await bot.session.close()
         logger.info("👋 Работа завершена")
@@ -43,12 +78,53 @@ async def main():
     dp.shutdown.register(on_shutdown)
 
     # Запуск
-    await checker.start()
+    await notifier.start()
+    if checker:
+        await checker.start()
+    if relay:
+        await relay.start()
+
+    if webhook:
+        await webhook.start()
+        logger.info("🤖 Бот запущен! Webhook...")
+        await dp.emit_startup(bot=bot)
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await dp.emit_shutdown(bot=bot)
+        return
 
+    # getUpdates не работает, пока зарегистрирован вебхук — например, после смены BOT_MODE
+    await bot.delete_webhook()
     logger.info("🤖 Бот запущен! Polling...")
     await dp.start_polling(bot)
 
 
+async def run_worker():
+    """Воркер: опрашивает свою долю целей через свой прокси, уведомления кладёт в outbox"""
+    fetcher = SteamInventoryFetcher(ProxyPool.from_config(config.WORKER_PROXY_URLS))
+    await fetcher.open()
+
+    shard = ShardCoordinator(config.WORKER_ID, ",".join(config.WORKER_PROXY_URLS) or None)
+    checker = InventoryChecker(OutboxNotifier(), fetcher, shard)
+
+    metrics_server = await metrics.start_server()
+    await shard.start()
+    await checker.start()
+    logger.info(f"🛠 Воркер {config.WORKER_ID} запущен")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        logger.info("🔄 Завершение работы воркера...")
+        if metrics_server:
+            await metrics_server.cleanup()
+        await checker.stop()
+        await shard.stop()
+        await fetcher.close()
+        await db.close()
+        logger.info("👋 Воркер остановлен")
+
+
 if __name__ == "__main__":
     try:
         asyncio.run(main())
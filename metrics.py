@@ -0,0 +1,231 @@
+"""Метрики в текстовом формате Prometheus без внешних зависимостей.
+
+Запись метрики — несколько операций над словарём и списком, поэтому
+инструментирование горячего пути можно держать включённым в проде.
+"""
+import bisect
+import time
+from abc import ABC, abstractmethod
+from contextvars import ContextVar
+from typing import Callable, Optional
+from aiohttp import web
+from config import config
+
+# Границы по умолчанию — от миллисекунды до полуминуты
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+_registry: list["_Metric"] = []
+
+# Профилировщик кладёт сюда словарь проверяемой цели: гистограммы добавляют в него своё время
+phase_trace: ContextVar[Optional[dict]] = ContextVar("phase_trace", default=None)
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric(ABC):
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._children: dict[tuple, "_Metric"] = {}
+        _registry.append(self)
+
+    def labels(self, *values) -> "_Metric":
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self._child()
+        return child
+
+    @abstractmethod
+    def _child(self) -> "_Metric":
+        ...
+
+    @abstractmethod
+    def _samples(self, labels: tuple):
+        ...
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        children = self._children.items() if self.labelnames else [((), self)]
+        for values, child in children:
+            for suffix, extra, value in child._samples(values):
+                lines.append(f"{self.name}{suffix}{_format_labels(self.labelnames, values, extra)} {value}")
+        return "\n".join(lines)
+
+    def _new(self):
+        # Дочерняя метрика не регистрируется — её выводит родитель
+        child = object.__new__(type(self))
+        child.name, child.labelnames, child._children = self.name, (), {}
+        return child
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        super().__init__(name, documentation, labelnames)
+        self.value = 0.0
+
+    def _child(self):
+        child = self._new()
+        child.value = 0.0
+        return child
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def _samples(self, labels):
+        return [("", "", self.value)]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        super().__init__(name, documentation, labelnames)
+        self.value = 0.0
+        self._function: Optional[Callable[[], float]] = None
+
+    def _child(self):
+        child = self._new()
+        child.value, child._function = 0.0, None
+        return child
+
+    def set(self, value: float):
+        self.value = value
+
+    def set_function(self, function: Callable[[], float]):
+        """Значение считается в момент опроса (например, длина очереди)"""
+        self._function = function
+
+    def _samples(self, labels):
+        return [("", "", self._function() if self._function else self.value)]
+
+
+class _Timer:
+    __slots__ = ("histogram", "started")
+
+    def __init__(self, histogram: "Histogram"):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.histogram.observe(time.perf_counter() - self.started)
+
+    # Чтобы стоять в одном async with рядом с блокировкой
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.__exit__(exc_type, exc_val, exc_tb)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (),
+                 buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+
+    def _child(self):
+        child = self._new()
+        child.buckets = self.buckets
+        child._counts = [0] * (len(self.buckets) + 1)
+        child.sum = 0.0
+        return child
+
+    def observe(self, value: float):
+        self._counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        trace = phase_trace.get()
+        if trace is not None:
+            trace[self.name] = trace.get(self.name, 0.0) + value
+
+    def time(self) -> _Timer:
+        return _Timer(self)
+
+    def _samples(self, labels):
+        samples = []
+        total = 0
+        for bound, count in zip(self.buckets, self._counts):
+            total += count
+            samples.append(("_bucket", f'le="{bound}"', total))
+        total += self._counts[-1]
+        samples.append(("_bucket", 'le="+Inf"', total))
+        samples.append(("_sum", "", self.sum))
+        samples.append(("_count", "", total))
+        return samples
+
+
+def render() -> str:
+    return "\n".join(metric.render() for metric in _registry) + "\n"
+
+
+# --- Steam ---
+STEAM_FETCH_SECONDS = Histogram("steam_fetch_seconds", "Время ответа Steam на запрос страницы инвентаря")
+STEAM_DECODE_SECONDS = Histogram("steam_decode_seconds", "Разбор JSON страницы инвентаря")
+STEAM_RESPONSES = Counter("steam_responses_total", "Ответы Steam по HTTP-статусу", ("status",))
+STEAM_RETRIES = Counter("steam_retries_total", "Повторные запросы страницы инвентаря")
+STEAM_TIMEOUTS = Counter("steam_timeouts_total", "Таймауты запросов к Steam")
+STEAM_COALESCED = Counter("steam_coalesced_total", "Страницы, полученные без своего запроса к Steam", ("source",))
+STEAM_NETWORK_ERRORS = Counter("steam_network_errors_total", "Сетевые ошибки запросов к Steam")
+DIFF_SECONDS = Histogram("inventory_diff_seconds", "Вычисление дельты инвентаря без сетевых запросов и записи в БД")
+
+# --- База данных ---
+DB_WRITE_SECONDS = Histogram("db_write_seconds", "Запись в БД под блокировкой записи", ("op",))
+
+# --- Планировщик ---
+CHECKS = Counter("inventory_checks_total", "Проверки инвентарей по результату", ("result",))
+CYCLE_SECONDS = Gauge("check_cycle_seconds", "Длительность последнего цикла проверки")
+CYCLE_TARGETS = Gauge("check_cycle_targets", "Целей в последнем цикле проверки")
+SCHEDULED_TARGETS = Gauge("scheduled_targets", "Целей в расписании этого процесса")
+
+# --- Уведомления ---
+NOTIFY_SEND_SECONDS = Histogram("notification_send_seconds", "Отправка уведомления в Telegram")
+NOTIFY_QUEUE_DEPTH = Gauge("notification_queue_depth", "Чатов в очереди на отправку")
+NOTIFICATIONS = Counter("notifications_total", "Отправленные сообщения по результату", ("result",))
+TELEGRAM_RETRY_AFTER = Counter("telegram_retry_after_total", "Ответы Telegram с RetryAfter")
+
+# --- Вебхук Telegram ---
+WEBHOOK_UPDATES = Counter("webhook_updates_total", "Обновления, пришедшие на вебхук, по результату", ("result",))
+WEBHOOK_HANDLE_SECONDS = Histogram("webhook_handle_seconds", "Обработка обновления хендлерами бота")
+WEBHOOK_IN_FLIGHT = Gauge("webhook_updates_in_flight", "Обновлений в обработке")
+
+
+async def handle_metrics(request: web.Request) -> web.Response:
+    return web.Response(text=render(), content_type="text/plain", charset="utf-8")
+
+
+async def start_server(host: str = None, port: int = None) -> Optional[web.AppRunner]:
+    """Поднимает /metrics; METRICS_PORT=0 — выключено"""
+    host = host or config.METRICS_HOST
+    port = config.METRICS_PORT if port is None else port
+    if not port:
+        return None
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, host, port).start()
+    except OSError as e:
+        # Например, порт занят соседним воркером — работаем без метрик
+        print(f"⚠️ Не удалось открыть /metrics на {host}:{port}: {e}")
+        await runner.cleanup()
+        return None
+    print(f"📈 Метрики: http://{host}:{port}/metrics")
+    return runner
@@ -0,0 +1,196 @@
+import asyncio
+import json
+import time
+from aiogram.exceptions import TelegramRetryAfter
+import metrics
+from config import config
+from database import db
+from rate_limiter import TokenBucket
+from steam_api import InventoryItem
+from telegram_bot import InventoryBot
+
+# Сколько раз пробуем записать уведомления в outbox, пока БД занята другими процессами
+OUTBOX_WRITE_ATTEMPTS = 3
+
+
+class NotificationDispatcher:
+    """Доставка уведомлений отдельно от опроса Steam: очередь чатов, лимиты Telegram, склейка"""
+
+    def __init__(self, bot_wrapper: InventoryBot):
+        self.bot_wrapper = bot_wrapper
+        # В очереди — id чатов, сами уведомления копятся в _pending до отправки
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=config.NOTIFY_QUEUE_SIZE)
+        self._pending: dict[int, list] = {}
+        self._limiter = TokenBucket(config.TELEGRAM_MESSAGES_PER_SECOND, config.TELEGRAM_RATE_BURST)
+        self._last_sent: dict[int, float] = {}
+        # Чаты, в которые сейчас отправляет какой-то воркер
+        self._sending: dict[int, asyncio.Event] = {}
+        self._workers: list[asyncio.Task] = []
+        self._background: set[asyncio.Task] = set()
+
+    async def start(self):
+        self._workers = [
+            asyncio.create_task(self._worker())
+            for _ in range(config.NOTIFY_WORKERS)
+        ]
+        metrics.NOTIFY_QUEUE_DEPTH.set_function(lambda: self.queue_size)
+        print(f"✅ Диспетчер уведомлений запущен (воркеров: {config.NOTIFY_WORKERS})")
+
+    async def stop(self):
+        # Даём дослать то, что уже в очереди
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=config.NOTIFY_DRAIN_SECONDS)
+        except asyncio.TimeoutError:
+            print(f"⚠️ Не доставлено уведомлений для {len(self._pending)} чатов")
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+
+    @property
+    def queue_size(self) -> int:
+        return self._queue.qsize()
+
+    async def notify(self, chat_id: int, kind: str, steamid64: str, appid: int, items: list):
+        """Ставит уведомление в очередь; kind — "added" или "removed" """
+        payload = (kind, steamid64, appid, items)
+        if chat_id in self._pending:
+            # Чат уже ждёт отправки — уйдёт одним сообщением
+            self._pending[chat_id].append(payload)
+            return
+        self._pending[chat_id] = [payload]
+        # Очередь ограничена: при переполнении опрос притормаживает здесь
+        await self._queue.put(chat_id)
+
+    async def notify_many(self, chat_ids, steamid64: str, appid: int, notifications: list[tuple[str, list]]):
+        """Раздаёт изменения одного инвентаря всем подписчикам; сбой одного чата не мешает остальным"""
+        for chat_id in chat_ids:
+            for kind, items in notifications:
+                try:
+                    await self.notify(chat_id, kind, steamid64, appid, items)
+                except Exception as e:
+                    print(f"❌ Не удалось поставить уведомление для {chat_id}: {e}")
+
+    async def _worker(self):
+        while True:
+            chat_id = await self._queue.get()
+            try:
+                await self._deliver(chat_id)
+            except Exception as e:
+                metrics.NOTIFICATIONS.labels("error").inc()
+                print(f"❌ Ошибка отправки уведомления пользователю {chat_id}: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _deliver(self, chat_id: int):
+        # Чат снова попал в очередь, пока другой воркер ему отправляет, — ждём, а не шлём параллельно
+        while (sending := self._sending.get(chat_id)) is not None:
+            await sending.wait()
+        self._sending[chat_id] = done = asyncio.Event()
+        try:
+            await self._send_batch(chat_id)
+        finally:
+            del self._sending[chat_id]
+            done.set()
+
+    async def _send_batch(self, chat_id: int):
+        # Не чаще одного сообщения в чат за TELEGRAM_CHAT_INTERVAL
+        wait = self._last_sent.get(chat_id, 0) + config.TELEGRAM_CHAT_INTERVAL - time.monotonic()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        await self._limiter.acquire()
+
+        # Забираем пачку только сейчас: всё, что пришло за время ожидания, уйдёт вместе
+        batch = self._pending.pop(chat_id, None)
+        if not batch:
+            return
+
+        text = self.bot_wrapper.format_notification_batch(batch)
+        try:
+            with metrics.NOTIFY_SEND_SECONDS.time():
+                await self.bot_wrapper.bot.send_message(chat_id, text, parse_mode="Markdown")
+        except TelegramRetryAfter as e:
+            metrics.TELEGRAM_RETRY_AFTER.inc()
+            print(f"⚠️ Telegram flood control: ждём {e.retry_after}с")
+            self._limiter.backoff(e.retry_after)
+            self._requeue(chat_id, batch)
+            return
+        finally:
+            self._last_sent[chat_id] = time.monotonic()
+
+        metrics.NOTIFICATIONS.labels("sent").inc()
+        self._forget_idle_chats()
+
+    def _requeue(self, chat_id: int, batch: list):
+        if chat_id in self._pending:
+            # Чат уже снова в очереди — добавим неотправленное в начало
+            self._pending[chat_id][:0] = batch
+            return
+        self._pending[chat_id] = batch
+        try:
+            self._queue.put_nowait(chat_id)
+        except asyncio.QueueFull:
+            # Не блокируем воркер: дождёмся места в фоне
+            task = asyncio.create_task(self._queue.put(chat_id))
+            self._background.add(task)
+            task.add_done_callback(self._background.discard)
+
+    def _forget_idle_chats(self):
+        if len(self._last_sent) < 10_000:
+            return
+        threshold = time.monotonic() - config.TELEGRAM_CHAT_INTERVAL
+        self._last_sent = {chat: ts for chat, ts in self._last_sent.items() if ts > threshold}
+
+
+class OutboxNotifier:
+    """Для воркеров: вместо отправки кладёт уведомления в outbox, их доставит процесс бота"""
+
+    async def notify(self, chat_id: int, kind: str, steamid64: str, appid: int, items: list):
+        await self.notify_many([chat_id], steamid64, appid, [(kind, items)])
+
+    async def notify_many(self, chat_ids, steamid64: str, appid: int, notifications: list[tuple[str, list]]):
+        """Все уведомления об одном инвентаре — одной транзакцией: подписчики получают их все или никто"""
+        payloads = [
+            (kind, json.dumps([[item.key, item.classid, item.name] for item in items]))
+            for kind, items in notifications
+        ]
+        rows = [(chat_id, kind, steamid64, appid, items) for chat_id in chat_ids for kind, items in payloads]
+        for attempt in range(OUTBOX_WRITE_ATTEMPTS):
+            try:
+                await db.add_outbox_notifications(rows)
+                return
+            except Exception as e:
+                # Обычно SQLITE_BUSY от соседнего процесса: снапшот уже записан, так что пробуем ещё
+                if attempt == OUTBOX_WRITE_ATTEMPTS - 1:
+                    raise
+                print(f"⚠️ Outbox занят ({e}), повтор")
+                await asyncio.sleep(0.5 * (attempt + 1))
+
+
+class OutboxRelay:
+    """Для процесса бота: перекладывает уведомления воркеров из outbox в диспетчер"""
+
+    def __init__(self, dispatcher: NotificationDispatcher):
+        self.dispatcher = dispatcher
+        self._task: asyncio.Task | None = None
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    async def _run(self):
+        while True:
+            try:
+                rows = await db.take_outbox_notifications()
+                for tg_user_id, kind, steamid64, appid, items in rows:
+                    items = [InventoryItem(*item) for item in json.loads(items)]
+                    await self.dispatcher.notify(tg_user_id, kind, steamid64, appid, items)
+            except Exception as e:
+                print(f"❌ Ошибка чтения outbox: {e}")
+                rows = []
+            # Пока outbox не пуст, забираем без паузы
+            if not rows:
+                await asyncio.sleep(config.OUTBOX_POLL_SECONDS)
@@ -0,0 +1,316 @@
+"""Профилирование циклов проверки по запросу и трассы медленных циклов.
+
+Сеанс (/profile N или PROFILE_CYCLES) на N циклов включает сэмплирующий профилировщик
+потока event loop, замер задержки loop и поиск медленных колбэков. По окончании в PROFILE_DIR появляется каталог с отчётом, стеками в формате
+folded (flamegraph.pl, speedscope) и разбивкой времени по целям.
+
+Разбивку по фазам дают уже расставленные гистограммы metrics: пока цель проверяется,
+их время копится в её словаре (metrics.phase_trace). Всё, что не попало в фазы —
+ожидание лимитеров и прокси, чтение тела ответа, блокировка записи, — это «прочее».
+"""
+import asyncio
+import contextlib
+import csv
+import heapq
+import statistics
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Awaitable, Callable, Optional
+import metrics
+from config import config
+
+# Гистограммы, из которых складывается время проверки цели, и их колонки в отчёте
+PHASES = {
+    metrics.STEAM_FETCH_SECONDS.name: "steam",
+    metrics.STEAM_DECODE_SECONDS.name: "decode",
+    metrics.DIFF_SECONDS.name: "diff",
+    metrics.DB_WRITE_SECONDS.name: "db",
+}
+COLUMNS = [*PHASES.values(), "other"]
+# Как часто проверяем задержку event loop
+LAG_INTERVAL = 0.05
+
+
+class CycleTrace:
+    """Время проверки каждой цели одного цикла с разбивкой по фазам"""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.elapsed = 0.0
+        # (steamid64, appid, всего, {колонка: секунды})
+        self.targets: list[tuple[str, int, float, dict]] = []
+
+    @contextlib.contextmanager
+    def target(self, steamid64: str, appid: int):
+        phases: dict[str, float] = {}
+        token = metrics.phase_trace.set(phases)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            total = time.perf_counter() - started
+            metrics.phase_trace.reset(token)
+            breakdown = {PHASES.get(name, name): spent for name, spent in phases.items()}
+            breakdown["other"] = max(0.0, total - sum(breakdown.values()))
+            self.targets.append((steamid64, appid, total, breakdown))
+
+    def finish(self):
+        self.elapsed = time.monotonic() - self.started
+
+    def slowest(self, n: int) -> list[tuple[str, int, float, dict]]:
+        return heapq.nlargest(n, self.targets, key=lambda t: t[2])
+
+
+class StackSampler(threading.Thread):
+    """Раз в interval снимает стек потока event loop и считает одинаковые стеки"""
+
+    def __init__(self, thread_id: int, interval: float):
+        super().__init__(name="stack-sampler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+    def hottest(self, n: int) -> list[tuple[str, int]]:
+        """Функции, на которых чаще всего стоял поток (собственное время)"""
+        own: Counter = Counter()
+        for stack, count in self.stacks.items():
+            own[stack.rsplit(";", 1)[-1]] += count
+        return own.most_common(n)
+
+
+class SlowCallbacks:
+    """Засекает каждый колбэк event loop и запоминает те, что дольше threshold.
+
+    Как slow_callback_duration в отладочном режиме asyncio, но без него: отладочный режим
+    снимает стек при создании каждой задачи и future и сам замедляет цикл в разы.
+    """
+
+    def __init__(self, threshold: float):
+        self.threshold = threshold
+        self.records: list[str] = []
+        self._original = None
+
+    def install(self):
+        original = self._original = asyncio.Handle._run
+        threshold, records = self.threshold, self.records
+
+        def _run(handle):
+            started = time.perf_counter()
+            original(handle)
+            spent = time.perf_counter() - started
+            if spent > threshold:
+                records.append(f"{spent * 1000:.0f} мс: {_describe(handle)}")
+
+        asyncio.Handle._run = _run
+
+    def uninstall(self):
+        if self._original:
+            asyncio.Handle._run = self._original
+            self._original = None
+
+
+class ProfileSession:
+    def __init__(self, cycles: int, on_done: Optional[Callable[[str, str], Awaitable]] = None):
+        self.cycles = cycles
+        self.remaining = cycles
+        self.on_done = on_done
+        self.traces: list[CycleTrace] = []
+        self.lags: list[float] = []
+        self._loop = asyncio.get_running_loop()
+        self._sampler = StackSampler(threading.get_ident(), config.PROFILE_SAMPLE_MS / 1000)
+        self._slow_callbacks = SlowCallbacks(config.PROFILE_SLOW_CALLBACK_MS / 1000)
+        self._lag_task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._slow_callbacks.install()
+        self._lag_task = asyncio.create_task(self._watch_lag())
+        self._sampler.start()
+
+    def stop(self):
+        self._sampler.stop()
+        self._lag_task.cancel()
+        self._slow_callbacks.uninstall()
+
+    async def _watch_lag(self):
+        while True:
+            started = self._loop.time()
+            await asyncio.sleep(LAG_INTERVAL)
+            self.lags.append(self._loop.time() - started - LAG_INTERVAL)
+
+    def summary(self) -> str:
+        """Короткая сводка для сообщения администратору"""
+        durations = [trace.elapsed for trace in self.traces]
+        lines = [f"Циклов: {len(durations)}, длительность: {', '.join(f'{d:.1f}с' for d in durations)}"]
+        lines.append(_phase_totals(self.traces))
+        if self.lags:
+            lines.append(f"Задержка loop: p50 {_ms(statistics.median(self.lags))}, "
+                         f"p99 {_ms(_percentile(self.lags, 0.99))}, max {_ms(max(self.lags))}")
+        lines.append(f"Медленных колбэков (>{config.PROFILE_SLOW_CALLBACK_MS:.0f} мс): "
+                     f"{len(self._slow_callbacks.records)}")
+        return "\n".join(lines)
+
+    def write(self, directory: Path):
+        directory.mkdir(parents=True, exist_ok=True)
+        with open(directory / "stacks.folded", "w") as f:
+            for stack, count in self._sampler.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        with open(directory / "targets.csv", "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["cycle", "steamid64", "appid", "total", *COLUMNS])
+            for n, trace in enumerate(self.traces, 1):
+                for steamid64, appid, total, breakdown in trace.targets:
+                    writer.writerow([n, steamid64, appid, f"{total:.6f}",
+                                     *(f"{breakdown.get(c, 0.0):.6f}" for c in COLUMNS)])
+
+        lines = [self.summary(), "", "Самые медленные цели:"]
+        slowest = heapq.nlargest(
+            config.PROFILE_SLOW_TARGETS,
+            (target for trace in self.traces for target in trace.targets),
+            key=lambda t: t[2]
+        )
+        lines += _format_targets(slowest)
+        lines += ["", f"Горячие функции ({sum(self._sampler.stacks.values())} сэмплов):"]
+        lines += [f"  {count:>6}  {name}" for name, count in self._sampler.hottest(30)]
+        if self._slow_callbacks.records:
+            lines += ["", "Медленные колбэки:"]
+            lines += [f"  {record}" for record in self._slow_callbacks.records[:100]]
+        (directory / "summary.txt").write_text("\n".join(lines) + "\n")
+
+
+class CycleProfiler:
+    """Точка входа для планировщика: трасса на каждый цикл и сеансы профилирования"""
+
+    def __init__(self):
+        self.session: Optional[ProfileSession] = None
+        self._pending: Optional[tuple[int, Optional[Callable]]] = None
+
+    @property
+    def active(self) -> bool:
+        return self.session is not None or self._pending is not None
+
+    def arm(self, cycles: int, on_done: Optional[Callable[[str, str], Awaitable]] = None) -> bool:
+        """Профилировать следующие cycles циклов; False — сеанс уже идёт.
+        on_done получает путь к каталогу с результатами и сводку"""
+        if self.active:
+            return False
+        self._pending = (cycles, on_done)
+        return True
+
+    def begin_cycle(self) -> Optional[CycleTrace]:
+        if self._pending:
+            self.session = ProfileSession(*self._pending)
+            self._pending = None
+            self.session.start()
+            print(f"🔬 Профилирование следующих {self.session.cycles} циклов")
+        # Без сеанса и порога медленного цикла трасса не нужна — цели проверяются как обычно
+        if self.session or config.PROFILE_SLOW_CYCLE_SECONDS > 0:
+            return CycleTrace()
+        return None
+
+    async def end_cycle(self, trace: Optional[CycleTrace]):
+        if trace is None:
+            return
+        trace.finish()
+        try:
+            if self.session:
+                await self._record(trace)
+            elif trace.elapsed > config.PROFILE_SLOW_CYCLE_SECONDS:
+                path = Path(config.PROFILE_DIR) / f"slow-cycle-{_stamp()}.txt"
+                await asyncio.to_thread(_write_slow_cycle, path, trace)
+                print(f"🐢 Цикл шёл {trace.elapsed:.1f}с — трасса медленных целей: {path}")
+        except Exception as e:
+            print(f"❌ Не удалось сохранить профиль: {e}")
+
+    async def _record(self, trace: CycleTrace):
+        session = self.session
+        session.traces.append(trace)
+        session.remaining -= 1
+        if session.remaining > 0:
+            return
+        self.session = None
+        session.stop()
+        directory = Path(config.PROFILE_DIR) / f"profile-{_stamp()}"
+        await asyncio.to_thread(session.write, directory)
+        print(f"🔬 Профиль сохранён: {directory}")
+        if session.on_done:
+            await session.on_done(str(directory), session.summary())
+
+
+def _describe(handle: asyncio.Handle) -> str:
+    # Шаг задачи интереснее самого колбэка: показываем корутину и где она остановилась
+    task = getattr(handle._callback, "__self__", None)
+    if isinstance(task, asyncio.Task):
+        coro = task.get_coro()
+        frame = getattr(coro, "cr_frame", None)
+        where = f" ({Path(frame.f_code.co_filename).name}:{frame.f_lineno})" if frame else ""
+        return f"{getattr(coro, '__qualname__', coro)!s:.200}{where}"
+    return f"{handle!r:.300}"
+
+
+def _write_slow_cycle(path: Path, trace: CycleTrace):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    lines = [
+        f"Цикл: {trace.elapsed:.1f}с, целей: {len(trace.targets)}",
+        _phase_totals([trace]),
+        "",
+        "Самые медленные цели:",
+        *_format_targets(trace.slowest(config.PROFILE_SLOW_TARGETS)),
+    ]
+    path.write_text("\n".join(lines) + "\n")
+
+
+def _phase_totals(traces: list[CycleTrace]) -> str:
+    totals = Counter()
+    for trace in traces:
+        for *_, breakdown in trace.targets:
+            totals.update(breakdown)
+    spent = sum(totals.values()) or 1.0
+    # Суммы по целям: при параллельной проверке больше длительности цикла
+    return "Время целей по фазам: " + ", ".join(
+        f"{column} {totals[column]:.1f}с ({totals[column] / spent:.0%})" for column in COLUMNS
+    )
+
+
+def _format_targets(targets: list[tuple[str, int, float, dict]]) -> list[str]:
+    return [
+        f"  {steamid64}/{appid}: {_ms(total)} — "
+        + ", ".join(f"{column} {_ms(breakdown.get(column, 0.0))}" for column in COLUMNS)
+        for steamid64, appid, total, breakdown in targets
+    ]
+
+
+def _percentile(values: list[float], p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def _ms(seconds: float) -> str:
+    return f"{seconds * 1000:.0f} мс"
+
+
+def _stamp() -> str:
+    return time.strftime("%Y%m%d-%H%M%S")
+
+
+profiler = CycleProfiler()
+if config.PROFILE_CYCLES > 0:
+    profiler.arm(config.PROFILE_CYCLES)
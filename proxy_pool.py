@@ -0,0 +1,62 @@
+from typing import Optional
+from config import config
+from rate_limiter import TokenBucket
+
+# Сглаживание EWMA для задержки и доли ошибок
+EWMA_ALPHA = 0.2
+
+
+class ProxyState:
+    """Прокси (или прямое соединение, url=None) со своим лимитом и оценкой здоровья"""
+
+    def __init__(self, url: Optional[str], rate: float, burst: int):
+        self.url = url
+        self.bucket = TokenBucket(rate, burst)
+        self.latency = 1.0
+        self.error_rate = 0.0
+        self.in_flight = 0
+        self.consecutive_failures = 0
+
+    @property
+    def penalty(self) -> float:
+        """Чем меньше, тем здоровее: медленные, ошибающиеся и загруженные прокси — в конец"""
+        return self.latency * (1 + 4 * self.error_rate) * (1 + self.in_flight)
+
+    def __repr__(self):
+        return self.url or "direct"
+
+
+class ProxyPool:
+    """Пул прокси: запрос уходит через самый здоровый из доступных прямо сейчас"""
+
+    def __init__(self, urls: list[Optional[str]], rate: float, burst: int):
+        self.proxies = [ProxyState(url, rate, burst) for url in (urls or [None])]
+
+    @classmethod
+    def from_config(cls, urls: Optional[list[str]] = None) -> "ProxyPool":
+        return cls(urls if urls is not None else config.PROXY_URLS,
+                   config.STEAM_REQUESTS_PER_SECOND, config.STEAM_RATE_BURST)
+
+    async def acquire(self) -> ProxyState:
+        # Быстрее всех свободный токен + лучшая оценка; прокси на паузе после 429 ждут дольше всех
+        proxy = min(self.proxies, key=lambda p: p.bucket.wait_time() + p.penalty)
+        await proxy.bucket.acquire()
+        proxy.in_flight += 1
+        return proxy
+
+    def release(self, proxy: ProxyState):
+        proxy.in_flight -= 1
+
+    def report_success(self, proxy: ProxyState, latency: float):
+        proxy.latency += EWMA_ALPHA * (latency - proxy.latency)
+        proxy.error_rate -= EWMA_ALPHA * proxy.error_rate
+        proxy.consecutive_failures = 0
+
+    def report_failure(self, proxy: ProxyState, cooldown: float):
+        """429, 5xx или таймаут: прокси уходит на паузу, растущую с каждым подряд провалом"""
+        proxy.error_rate += EWMA_ALPHA * (1 - proxy.error_rate)
+        if proxy.bucket.paused:
+            # Запросы, ушедшие до паузы, приносят тот же провал — пауза на него уже назначена
+            return
+        proxy.consecutive_failures += 1
+        proxy.bucket.backoff(min(cooldown * proxy.consecutive_failures, config.PROXY_MAX_COOLDOWN))
@@ -0,0 +1,58 @@
+import asyncio
+import time
+
+
+class TokenBucket:
+    """Token bucket: rate токенов в секунду, не больше burst за раз"""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._waiters = 0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        """Ждёт, пока не появится свободный токен (очередь FIFO)"""
+        self._waiters += 1
+        try:
+            async with self._lock:
+                while True:
+                    now = time.monotonic()
+                    if now < self._paused_until:
+                        await asyncio.sleep(self._paused_until - now)
+                        continue
+
+                    self._refill(now)
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+
+                    await asyncio.sleep((1 - self._tokens) / self.rate)
+        finally:
+            self._waiters -= 1
+
+    def wait_time(self) -> float:
+        """Примерное ожидание токена для нового запроса, с учётом очереди и паузы"""
+        now = time.monotonic()
+        start = max(now, self._paused_until)
+        tokens = min(self.capacity, self._tokens + max(0.0, start - self._updated) * self.rate)
+        missing = self._waiters + 1 - tokens
+        return start - now + max(0.0, missing) / self.rate
+
+    @property
+    def paused(self) -> bool:
+        return time.monotonic() < self._paused_until
+
+    def backoff(self, seconds: float):
+        """Приостанавливает выдачу токенов (например, после 429)"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        # После паузы начинаем с пустого ведра, без накопленного burst
+        self._tokens = 0.0
+        self._updated = self._paused_until
@@ -1,64 +1,286 @@
 import asyncio
+import heapq
+import math
+import random
+import time
+from typing import Optional
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
+import metrics
 from config import config
 from database import db
 from steam_api import SteamInventoryFetcher, SteamAPIError
-from telegram_bot import InventoryBot
+from notifier import NotificationDispatcher, OutboxNotifier
+from profiler import CycleTrace, profiler
+from sharding import ShardCoordinator
+
+
+# Состояние целей пишем в БД пачками: при падении перепроверим не больше этого числа
+STATE_FLUSH_BATCH = 50
+
+
+class TargetSchedule:
+    """Очередь целей с собственным временем следующей проверки у каждой"""
+
+    def __init__(self):
+        # В куче могут лежать устаревшие записи: актуальное время — в _next_check
+        self._heap: list[tuple[float, tuple[str, int]]] = []
+        self._next_check: dict[tuple[str, int], float] = {}
+        self._interval: dict[tuple[str, int], float] = {}
+        self._failures: dict[tuple[str, int], int] = {}
+
+    def __len__(self):
+        return len(self._next_check)
+
+    def __contains__(self, target: tuple[str, int]):
+        return target in self._next_check
+
+    def sync(self, targets: list[tuple[str, int]], now: float):
+        """Новые цели проверяем сразу, удалённые забываем"""
+        current = set(targets)
+        for target in current - self._next_check.keys():
+            self._interval[target] = config.CHECK_INTERVAL_MINUTES * 60
+            self._push(target, now)
+        for target in self._next_check.keys() - current:
+            del self._next_check[target]
+            self._interval.pop(target, None)
+            self._failures.pop(target, None)
+
+    def load(self, states: list[tuple]):
+        """Восстанавливает расписание, сохранённое до рестарта"""
+        for steamid64, appid, next_check_at, interval, failures in states:
+            target = (steamid64, appid)
+            self._interval[target] = interval
+            if failures:
+                self._failures[target] = failures
+            self._push(target, next_check_at)
+
+    def state(self, target: tuple[str, int]) -> tuple[float, float, int]:
+        return self._next_check[target], self._interval[target], self._failures.get(target, 0)
+
+    def pop_due(self, now: float) -> list[tuple[str, int]]:
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            at, target = heapq.heappop(self._heap)
+            if self._next_check.get(target) == at:
+                due.append(target)
+        return due
+
+    def reschedule(self, target: tuple[str, int], now: float, changed: bool,
+                   failed: bool, subscribers: int):
+        if target not in self._next_check:
+            return
+
+        base = config.CHECK_INTERVAL_MINUTES * 60
+        min_interval = config.CHECK_MIN_INTERVAL_SECONDS
+        max_interval = config.CHECK_MAX_INTERVAL_MINUTES * 60
+
+        if failed:
+            # Приватные и недоступные инвентари — экспоненциальная пауза
+            failures = self._failures.get(target, 0) + 1
+            self._failures[target] = failures
+            interval = min(max_interval, base * 2 ** failures)
+        else:
+            self._failures.pop(target, None)
+            if changed:
+                # Активный инвентарь — проверяем как можно чаще
+                interval = min_interval
+            else:
+                # Спокойный — постепенно остываем
+                interval = min(max_interval, self._interval[target] * config.CHECK_COOLDOWN_FACTOR)
+        self._interval[target] = interval
+
+        # Популярные цели чаще: интервал делится на 1 + log2(подписчиков)
+        effective = interval / (1 + math.log2(max(1, subscribers)))
+        effective = max(min_interval, effective)
+        # Немного разброса, чтобы цели не слипались в пачки
+        self._push(target, now + effective * random.uniform(0.9, 1.1))
+
+    def _push(self, target: tuple[str, int], at: float):
+        self._next_check[target] = at
+        heapq.heappush(self._heap, (at, target))
 
 
 class InventoryChecker:
-    def __init__(self, bot_wrapper: InventoryBot):
-        self.bot_wrapper = bot_wrapper
+    def __init__(self, notifier: NotificationDispatcher | OutboxNotifier, fetcher: SteamInventoryFetcher,
+                 shard: Optional[ShardCoordinator] = None):
+        self.notifier = notifier
+        # В шардированном режиме опрашиваем только свою долю целей
+        self.shard = shard
+        self._shard_version = shard.version if shard else 0
         self.scheduler = AsyncIOScheduler()
-        self.fetcher = None
+        # Общий с ботом fetcher: жизненным циклом сессии управляет main()
+        self.fetcher = fetcher
+        self.schedule = TargetSchedule()
+        # Один цикл за раз: следующий тик не стартует, пока не закончился предыдущий
+        self._cycle_lock = asyncio.Lock()
+        self._state_buffer: list[tuple] = []
 
     async def start(self):
-        self.fetcher = SteamInventoryFetcher(proxy=config.PROXY_URL)
-        await self.fetcher.__aenter__()
+        # Продолжаем с того места, где остановились до рестарта
+        restored = await self._load_schedule()
+        if restored:
+            print(f"🔁 Восстановлено расписание для {restored} целей")
 
+        # Частый тик забирает только те цели, чья очередь подошла
         self.scheduler.add_job(
             self._check_all,
             'interval',
-            minutes=config.CHECK_INTERVAL_MINUTES,
+            seconds=config.CHECK_TICK_SECONDS,
             id='inventory_check',
-            replace_existing=True
+            replace_existing=True,
+            max_instances=1,
+            coalesce=True
+        )
+        self.scheduler.add_job(
+            self._maintenance,
+            'interval',
+            minutes=config.DB_MAINTENANCE_MINUTES,
+            id='db_maintenance',
+            replace_existing=True,
+            max_instances=1,
+            coalesce=True
         )
         self.scheduler.start()
-        print(f"✅ Планировщик запущен (интервал: {config.CHECK_INTERVAL_MINUTES} мин)")
+        print(f"✅ Планировщик запущен (базовый интервал: {config.CHECK_INTERVAL_MINUTES} мин, "
+              f"тик: {config.CHECK_TICK_SECONDS}с)")
 
     async def stop(self):
         self.scheduler.shutdown()
-        if self.fetcher:
-            await self.fetcher.__aexit__(None, None, None)
+
+    async def _load_schedule(self) -> int:
+        states = await db.get_target_states()
+        if self.shard:
+            states = [state for state in states if self.shard.owns(state[0], state[1])]
+        self.schedule = TargetSchedule()
+        self.schedule.load(states)
+        return len(states)
+
+    async def _get_targets(self) -> list[tuple[str, int]]:
+        if not self.shard:
+            return db.get_targets()
+
+        # Подписки меняет процесс бота — перечитываем индекс
+        await db.reload_subscriptions()
+        if self.shard.version != self._shard_version:
+            # Кольцо изменилось: берём расписание доставшихся нам целей из БД
+            self._shard_version = self.shard.version
+            await self._flush_states()
+            await self._load_schedule()
+        return [target for target in db.get_targets() if self.shard.owns(*target)]
 
     async def _check_all(self):
-        """Проверяет все отслеживаемые инвентари"""
-        print("🔄 Запуск проверки инвентарей...")
+        """Проверяет инвентари, у которых подошло время проверки"""
+        if self._cycle_lock.locked():
+            return
+        async with self._cycle_lock:
+            await self._run_cycle()
+
+    async def _run_cycle(self):
+        # Цели уже сгруппированы по SteamID+appid в индексе подписок
+        targets = await self._get_targets()
+        now = time.time()
+        self.schedule.sync(targets, now)
+        targets = self.schedule.pop_due(now)
+        if not targets:
+            return
+
+        print(f"🔄 Запуск проверки инвентарей ({len(targets)} из {len(self.schedule)})...")
+        started = time.monotonic()
+        trace = profiler.begin_cycle()
+
+        # Пул воркеров: темп задают лимитеры прокси, а не сумма пауз между запросами
+        queue: asyncio.Queue = asyncio.Queue()
+        for target in targets:
+            queue.put_nowait(target)
+
+        workers = [
+            asyncio.create_task(self._worker(queue, trace))
+            for _ in range(min(config.STEAM_MAX_CONCURRENCY, len(targets)))
+        ]
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            await self._flush_states()
+            await profiler.end_cycle(trace)
+
+        metrics.CYCLE_SECONDS.set(time.monotonic() - started)
+        metrics.CYCLE_TARGETS.set(len(targets))
+        metrics.SCHEDULED_TARGETS.set(len(self.schedule))
+        print("✅ Проверка завершена")
+
+    async def _worker(self, queue: asyncio.Queue, trace: Optional[CycleTrace] = None):
+        while True:
+            try:
+                steamid64, appid = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            if trace is None:
+                await self._check_target(steamid64, appid)
+                continue
+            with trace.target(steamid64, appid):
+                await self._check_target(steamid64, appid)
+
+    async def _check_target(self, steamid64: str, appid: int):
+        changed = failed = False
+        error = None
+        try:
+            diff = await self.fetcher.get_inventory_diff(steamid64, appid)
+            # Первая проверка цели (например, раньше засева после /add) только засевает снапшот
+            changed = bool(diff) and not diff.initial
+            notifications = []
+            if changed and diff.added:
+                notifications.append(("added", diff.added))
+            if changed and config.NOTIFY_REMOVED_ITEMS and diff.removed:
+                notifications.append(("removed", diff.removed))
+
+            if notifications:
+                # Снапшот уже сохранён: сбой постановки уведомлений не делает проверку неудачной.
+                # Доставкой занимается диспетчер — опрос не ждёт Telegram
+                try:
+                    await self.notifier.notify_many(db.get_subscribers(steamid64, appid),
+                                                    steamid64, appid, notifications)
+                except Exception as e:
+                    print(f"❌ Не удалось поставить уведомления для {steamid64}/{appid}: {e}")
+
+        except SteamAPIError as e:
+            failed, error = True, str(e)
+            print(f"⚠️ SteamAPI ошибка для {steamid64}/{appid}: {e}")
+        except Exception as e:
+            failed, error = True, str(e)
+            print(f"❌ Ошибка проверки {steamid64}/{appid}: {e}")
 
-        # Группируем по SteamID+appid для избежания дубликатов запросов
-        tracked = await db.get_tracked_users()
-        targets = {(steamid64, appid) for _, steamid64, appid, _ in tracked}
+        target = (steamid64, appid)
+        now = time.time()
+        result = "error" if failed else "changed" if changed else "unchanged"
+        metrics.CHECKS.labels(result).inc()
+        self.schedule.reschedule(target, now, changed, failed, len(db.get_subscribers(steamid64, appid)))
+        if target in self.schedule:
+            self._state_buffer.append((steamid64, appid, *self.schedule.state(target), now, result, error))
+        if len(self._state_buffer) >= STATE_FLUSH_BATCH:
+            await self._flush_states()
 
-        for steamid64, appid in targets:
+    async def _maintenance(self):
+        """Чистка и обслуживание БД — только в паузе между циклами проверки"""
+        if self._cycle_lock.locked():
+            return
+        # В шардированном режиме чистит один воркер — первый в кольце
+        if self.shard and self.shard.ring.nodes[:1] != [self.shard.worker_id]:
+            return
+        # Держим блокировку цикла: тик, пришедший во время чистки или VACUUM, пропускается
+        async with self._cycle_lock:
             try:
-                await asyncio.sleep(config.STEAM_REQUEST_DELAY)  # соблюдаем лимиты
-
-                new_items = await self.fetcher.get_new_items(steamid64, appid)
-
-                if new_items:
-                    # Находим всех TG-пользователей, отслеживающих этот инвентарь
-                    users = await db.get_tracked_users(steamid64=steamid64)
-                    for tg_id, _, _, _ in users:
-                        try:
-                            await self.bot_wrapper.send_new_items_notification(
-                                tg_id, steamid64, appid, new_items
-                            )
-                        except Exception as e:
-                            print(f"❌ Ошибка отправки уведомления пользователю {tg_id}: {e}")
-
-            except SteamAPIError as e:
-                print(f"⚠️ SteamAPI ошибка для {steamid64}/{appid}: {e}")
+                if await db.ensure_incremental_vacuum():
+                    print("🧹 БД переведена в auto_vacuum=INCREMENTAL")
+                deleted = await db.cleanup_old_snapshots()
+                if deleted:
+                    print(f"🧹 Удалено {deleted} предметов из снапшотов неотслеживаемых инвентарей")
+                await db.optimize()
             except Exception as e:
-                print(f"❌ Ошибка проверки {steamid64}/{appid}: {e}")
+                print(f"❌ Ошибка обслуживания БД: {e}")
 
-        print("✅ Проверка завершена")
\ No newline at end of file
+    async def _flush_states(self):
+        states, self._state_buffer = self._state_buffer, []
+        try:
+            await db.save_target_states(states)
+        except Exception as e:
+            print(f"❌ Не удалось сохранить состояние опроса: {e}")
@@ -0,0 +1,74 @@
+import asyncio
+import bisect
+import hashlib
+import time
+from typing import Optional
+from config import config
+from database import db
+
+
+def _ring_hash(value: str) -> int:
+    return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], "big")
+
+
+class HashRing:
+    """Консистентное хеширование целей по воркерам: при смене состава переезжает ~1/N целей"""
+
+    def __init__(self, nodes: list[str], vnodes: int = 64):
+        self.nodes = sorted(nodes)
+        self._ring = sorted(
+            (_ring_hash(f"{node}#{i}"), node)
+            for node in self.nodes
+            for i in range(vnodes)
+        )
+        self._keys = [h for h, _ in self._ring]
+
+    def owner(self, steamid64: str, appid: int) -> Optional[str]:
+        if not self._ring:
+            return None
+        i = bisect.bisect(self._keys, _ring_hash(f"{steamid64}/{appid}")) % len(self._ring)
+        return self._ring[i][1]
+
+
+class ShardCoordinator:
+    """Держит аренду воркера в БД и решает, какие цели опрашивает этот воркер"""
+
+    def __init__(self, worker_id: str, proxy: Optional[str] = None):
+        self.worker_id = worker_id
+        self.proxy = proxy
+        self.ring = HashRing([worker_id])
+        # Растёт при каждой смене состава воркеров — планировщик по нему перечитывает расписание
+        self.version = 0
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        await self._renew()
+        self._task = asyncio.create_task(self._heartbeat())
+        print(f"✅ Воркер {self.worker_id} в кольце из {len(self.ring.nodes)}")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        # Освобождаем долю сразу, не дожидаясь истечения аренды
+        await db.release_worker_lease(self.worker_id)
+
+    def owns(self, steamid64: str, appid: int) -> bool:
+        return self.ring.owner(steamid64, appid) == self.worker_id
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(config.SHARD_LEASE_SECONDS / 3)
+            try:
+                await self._renew()
+            except Exception as e:
+                print(f"❌ Не удалось продлить аренду воркера {self.worker_id}: {e}")
+
+    async def _renew(self):
+        now = time.time()
+        await db.renew_worker_lease(self.worker_id, now + config.SHARD_LEASE_SECONDS, self.proxy)
+        workers = await db.get_live_workers(now)
+        if workers != self.ring.nodes:
+            self.ring = HashRing(workers)
+            self.version += 1
+            print(f"🔀 Состав воркеров изменился: {', '.join(workers)}")
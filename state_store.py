@@ -0,0 +1,98 @@
+import json
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Optional
+from config import config
+from database import db
+
+
+class StateStore(ABC):
+    """Состояние незавершённых диалогов (например, /add до выбора игры) по id пользователя.
+
+    Правила у всех хранилищ одни: запись живёт ttl секунд с последнего set (чтение срок
+    не продлевает), сверх maxsize вытесняются записи с самым давним set."""
+
+    @abstractmethod
+    async def get(self, key: int) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    async def set(self, key: int, value: dict):
+        ...
+
+    @abstractmethod
+    async def delete(self, key: int):
+        ...
+
+
+class MemoryStateStore(StateStore):
+    """В памяти; лимит размера соблюдается точно"""
+
+    def __init__(self, ttl: float, maxsize: int):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries: OrderedDict = OrderedDict()
+
+    async def get(self, key: int) -> Optional[dict]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        return value
+
+    async def set(self, key: int, value: dict):
+        now = time.monotonic()
+        self._entries[key] = (now + self.ttl, value)
+        # Порядок в словаре — порядок set, он же порядок истечения
+        self._entries.move_to_end(key)
+        # Спереди — самые давние: истёкшие и вытесняемые по размеру
+        while self._entries:
+            oldest_key, (expires_at, _) = next(iter(self._entries.items()))
+            if expires_at >= now and len(self._entries) <= self.maxsize:
+                break
+            del self._entries[oldest_key]
+
+    async def delete(self, key: int):
+        self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteStateStore(StateStore):
+    """В БД бота: переживает рестарт и деплой.
+
+    Истёкшие записи get не возвращает сразу, а вычищает их и лишние сверх maxsize раз
+    в PURGE_EVERY записей — между чистками в таблице может быть до maxsize + PURGE_EVERY
+    строк, так что лимит размера здесь приблизительный."""
+
+    # Чистим истёкшие и лишние записи не на каждой записи, а раз в столько
+    PURGE_EVERY = 100
+
+    def __init__(self, ttl: float, maxsize: int):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._writes = 0
+
+    async def get(self, key: int) -> Optional[dict]:
+        value = await db.get_conversation_state(key, time.time())
+        return json.loads(value) if value is not None else None
+
+    async def set(self, key: int, value: dict):
+        await db.set_conversation_state(key, json.dumps(value), time.time() + self.ttl)
+        self._writes += 1
+        if self._writes % self.PURGE_EVERY == 0:
+            await db.purge_conversation_states(time.time(), self.maxsize)
+
+    async def delete(self, key: int):
+        await db.delete_conversation_state(key)
+
+
+def create_state_store() -> StateStore:
+    if config.STATE_BACKEND == "sqlite":
+        return SQLiteStateStore(config.STATE_TTL_SECONDS, config.STATE_MAX_ENTRIES)
+    return MemoryStateStore(config.STATE_TTL_SECONDS, config.STATE_MAX_ENTRIES)
@@ -1,33 +1,170 @@
 import aiohttp
 import hashlib
 import asyncio
-from typing import Optional, List, Dict
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Optional, List, Dict, AsyncIterator
+import metrics
 from config import config
+from proxy_pool import ProxyPool
+from steam_json import decode_inventory
 
 
-def item_hash(item: dict) -> str:
-    """Создаёт уникальный хеш предмета"""
-    return hashlib.md5(
+def item_hash(item: dict) -> int:
+    """Создаёт уникальный 64-битный ключ предмета (первые 8 байт MD5)"""
+    digest = hashlib.md5(
         f"{item.get('assetid')}_{item.get('classid')}_{item.get('instanceid')}".encode()
-    ).hexdigest()
+    ).digest()
+    return int.from_bytes(digest[:8], "big", signed=True)
 
 
-def format_item_name(item: dict, descriptions: List[dict] = None) -> str:
-    """Форматирует название предмета для уведомления"""
-    name = item.get('classid', 'Unknown Item')
-    if descriptions:
-        desc = next((d for d in descriptions if str(d.get('classid')) == str(item.get('classid'))), {})
-        if desc.get('market_hash_name'):
-            name = desc['market_hash_name']
-        elif desc.get('name'):
-            name = desc['name']
-    return name
+def fingerprint_add(digest: int, h: int) -> int:
+    """Добавляет ключ предмета к отпечатку инвентаря (сумма по модулю 2^64, порядок не важен)"""
+    return (digest + h) & 0xFFFFFFFFFFFFFFFF
+
+
+@dataclass(slots=True)
+class Asset:
+    """Предмет из ответа Steam: только целочисленные id и готовый ключ снапшота"""
+    key: int
+    assetid: int
+    classid: int
+    instanceid: int
+
+    @classmethod
+    def from_json(cls, item: dict) -> "Asset":
+        return cls(item_hash(item), int(item['assetid']), int(item['classid']),
+                   int(item.get('instanceid') or 0))
+
+
+@dataclass(slots=True)
+class ItemDescription:
+    """Описание класса предмета; из всего блоба Steam нужно только название"""
+    classid: int
+    instanceid: int
+    name: Optional[str]
+
+    @classmethod
+    def from_json(cls, desc: dict) -> "ItemDescription":
+        return cls(int(desc['classid']), int(desc.get('instanceid') or 0),
+                   desc.get('market_hash_name') or desc.get('name'))
+
+
+@dataclass(slots=True)
+class InventoryItem:
+    """Изменившийся предмет для уведомления"""
+    key: int
+    classid: Optional[int]
+    name: Optional[str] = None
+
+
+class DescriptionIndex:
+    """Индекс описаний одной страницы по (classid, instanceid); строится при первом обращении"""
+
+    def __init__(self, descriptions: List[dict]):
+        self._descriptions = descriptions
+        self._index: Optional[Dict[tuple, ItemDescription]] = None
+
+    def get(self, classid: int, instanceid: int) -> Optional[ItemDescription]:
+        if self._index is None:
+            self.compact()
+        return self._index.get((classid, instanceid)) or self._index.get((classid, None))
+
+    def compact(self):
+        """Строит индекс и отпускает сырые описания Steam"""
+        if self._index is not None:
+            return
+        self._index = {}
+        for raw in self._descriptions:
+            d = ItemDescription.from_json(raw)
+            self._index[(d.classid, d.instanceid)] = d
+            # Запасной вариант: совпадение только по classid, как раньше
+            self._index.setdefault((d.classid, None), d)
+        self._descriptions = None
+
+
+class ItemNameCache:
+    """Общий для всех инвентарей LRU-кеш названий: (appid, classid) -> name"""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._names: OrderedDict = OrderedDict()
+
+    def get(self, appid: int, classid: int) -> Optional[str]:
+        key = (appid, classid)
+        name = self._names.get(key)
+        if name is not None:
+            self._names.move_to_end(key)
+        return name
+
+    def put(self, appid: int, classid: int, name: str):
+        key = (appid, classid)
+        self._names[key] = name
+        self._names.move_to_end(key)
+        if len(self._names) > self.maxsize:
+            self._names.popitem(last=False)
+
+
+class PageCache:
+    """Недавние страницы инвентаря: повторное чтение в пределах ttl не тратит запрос к Steam.
+
+    Размер ограничен суммарным числом предметов в страницах, а не числом страниц."""
+
+    def __init__(self, ttl: float, max_assets: int):
+        self.ttl = ttl
+        self.max_assets = max_assets
+        self._pages: OrderedDict = OrderedDict()
+        self._assets = 0
+
+    def get(self, key: tuple) -> Optional[Dict]:
+        entry = self._pages.get(key)
+        if entry is None:
+            return None
+        expires_at, page = entry
+        if expires_at < time.monotonic():
+            self._remove(key)
+            return None
+        return page
+
+    def put(self, key: tuple, page: Dict):
+        self._remove(key)
+        self._pages[key] = (time.monotonic() + self.ttl, page)
+        self._assets += len(page["assets"])
+        # Сначала уходят самые старые — они же истекают первыми
+        while self._assets > self.max_assets and len(self._pages) > 1:
+            self._remove(next(iter(self._pages)))
+
+    def _remove(self, key: tuple):
+        entry = self._pages.pop(key, None)
+        if entry is not None:
+            self._assets -= len(entry[1]["assets"])
+
+
+@dataclass
+class InventoryDiff:
+    """Изменения инвентаря с прошлой проверки"""
+    added: List[InventoryItem] = field(default_factory=list)
+    # Ушедшие из инвентаря предметы; название есть, только если оно в кеше
+    removed: List[InventoryItem] = field(default_factory=list)
+    # Тот же classid ушёл и вернулся под новым assetid (только с DETECT_MOVED_ITEMS)
+    moved: List[InventoryItem] = field(default_factory=list)
+    total_count: int = 0
+    # Первая проверка цели: снапшота ещё не было, «новые» предметы — весь инвентарь
+    initial: bool = False
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.moved)
 
 
 class SteamAPIError(Exception):
     pass
 
 
+class InventoryUnavailableError(SteamAPIError):
+    """Приватный инвентарь или явная ошибка от Steam — повтор запроса не поможет"""
+
+
 class SteamInventoryFetcher:
     BASE_URL = "https://steamcommunity.com/inventory"
     HEADERS = {
@@ -35,94 +172,317 @@ class SteamInventoryFetcher:
         "Accept": "application/json, text/plain, */*"
     }
 
-    def __init__(self, proxy: Optional[str] = None):
-        self.proxy = proxy
+    def __init__(self, pool: Optional[ProxyPool] = None):
+        # Каждый прокси со своим лимитом запросов; по умолчанию — из конфига
+        self.pool = pool or ProxyPool.from_config()
+        self.name_cache = ItemNameCache(config.ITEM_NAME_CACHE_SIZE) if config.ITEM_NAME_CACHE_SIZE else None
+        self.page_cache = PageCache(config.FETCH_CACHE_SECONDS, config.FETCH_CACHE_MAX_ASSETS) \
+            if config.FETCH_CACHE_SECONDS else None
+        # Запросы страниц в полёте: (валидаторы, задача) — одинаковые запросы ждут один ответ
+        self._in_flight: Dict[tuple, tuple] = {}
         self._session: Optional[aiohttp.ClientSession] = None
 
     async def __aenter__(self):
-        self._session = aiohttp.ClientSession(headers=self.HEADERS)
+        await self.open()
         return self
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def open(self):
+        # Один долгоживущий пул: keep-alive и кеш DNS избавляют от TLS-рукопожатия на каждый запрос
+        connector = aiohttp.TCPConnector(
+            limit=config.STEAM_POOL_SIZE,
+            limit_per_host=config.STEAM_POOL_PER_HOST,
+            keepalive_timeout=config.STEAM_KEEPALIVE_SECONDS,
+            ttl_dns_cache=config.STEAM_DNS_CACHE_SECONDS,
+            use_dns_cache=True
+        )
+        self._session = aiohttp.ClientSession(headers=self.HEADERS, connector=connector)
+
+    async def close(self):
         if self._session:
             await self._session.close()
 
     async def fetch_inventory(self, steamid64: str, appid: int,
-                              contextid: int = 2, count: int = 2000) -> Dict:
-        """Получает инвентарь пользователя"""
+                              contextid: int = 2, count: int = 2000,
+                              start_assetid: Optional[str] = None,
+                              etag: Optional[str] = None,
+                              last_modified: Optional[str] = None) -> Dict:
+        """Получает одну страницу инвентаря: из кеша, из уже идущего запроса или новым запросом"""
+        key = (steamid64, appid, contextid, count, start_assetid)
+        if self.page_cache:
+            page = self.page_cache.get(key)
+            if page is not None:
+                metrics.STEAM_COALESCED.labels("cache").inc()
+                return page
+
+        flight = self._in_flight.get(key)
+        if flight is not None:
+            validators, task = flight
+            page = await asyncio.shield(task)
+            # 304 верен только для тех же валидаторов, иначе нужен свой запрос
+            if not page.get("not_modified") or validators == (etag, last_modified):
+                metrics.STEAM_COALESCED.labels("in_flight").inc()
+                return page
+            return await self._request_page(steamid64, appid, contextid, count,
+                                            start_assetid, etag, last_modified)
+
+        task = asyncio.ensure_future(self._request_page(steamid64, appid, contextid, count,
+                                                        start_assetid, etag, last_modified))
+        self._in_flight[key] = ((etag, last_modified), task)
+        task.add_done_callback(lambda t: self._finish_flight(key, t))
+        # shield: отмена одного ожидающего не обрывает запрос для остальных
+        return await asyncio.shield(task)
+
+    def _finish_flight(self, key: tuple, task: asyncio.Task):
+        if self._in_flight.get(key, (None, None))[1] is task:
+            del self._in_flight[key]
+        if task.cancelled() or task.exception() is not None:
+            return
+        page = task.result()
+        if self.page_cache and not page.get("not_modified"):
+            # В кеше страница живёт дольше запроса — без сырых описаний Steam
+            page["descriptions"].compact()
+            self.page_cache.put(key, page)
+
+    async def _request_page(self, steamid64: str, appid: int, contextid: int, count: int,
+                            start_assetid: Optional[str], etag: Optional[str],
+                            last_modified: Optional[str]) -> Dict:
+        """Запрос одной страницы к Steam с повторами через пул прокси"""
         url = f"{self.BASE_URL}/{steamid64}/{appid}/{contextid}"
         params = {"l": "english", "count": count}
+        if start_assetid:
+            params["start_assetid"] = start_assetid
 
+        # Условный запрос, если Steam ранее отдал валидаторы
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+
+        last_error = "Не удалось получить инвентарь после нескольких попыток"
         for attempt in range(config.MAX_RETRY_ATTEMPTS):
+            if attempt:
+                metrics.STEAM_RETRIES.inc()
+            proxy = await self.pool.acquire()
+            started = time.monotonic()
+
             try:
                 async with self._session.get(
                         url,
                         params=params,
-                        proxy=self.proxy,
+                        headers=headers,
+                        proxy=proxy.url,
                         timeout=aiohttp.ClientTimeout(total=30)
                 ) as response:
+                    latency = time.monotonic() - started
+                    metrics.STEAM_FETCH_SECONDS.observe(latency)
+                    metrics.STEAM_RESPONSES.labels(response.status).inc()
 
                     if response.status == 429:
-                        wait_time = (attempt + 1) * 30
-                        print(f"⚠️ Rate limit (429). Ждём {wait_time}с...")
-                        await asyncio.sleep(wait_time)
+                        # Тормозим только этот прокси — повтор уйдёт через другой
+                        print(f"⚠️ Rate limit (429) на {proxy}. Прокси на паузе")
+                        self.pool.report_failure(proxy, config.PROXY_RATE_LIMIT_COOLDOWN)
                         continue
 
+                    if response.status in (200, 304):
+                        self.pool.report_success(proxy, latency)
+                    elif response.status >= 500:
+                        self.pool.report_failure(proxy, config.PROXY_ERROR_COOLDOWN)
+
+                    if response.status == 304:
+                        return {"not_modified": True}
+
                     if response.status == 403:
-                        raise SteamAPIError("Инвентарь приватный или профиль скрыт 🔒")
+                        raise InventoryUnavailableError("Инвентарь приватный или профиль скрыт 🔒")
 
                     if response.status != 200:
-                        raise SteamAPIError(f"HTTP {response.status}")
+                        # 5xx и прочее — скорее всего временно, пробуем ещё раз
+                        last_error = f"HTTP {response.status}"
+                        print(f"⚠️ Steam ответил {response.status} через {proxy} (попытка {attempt + 1})")
+                        continue
 
-                    data = await response.json()
+                    body = await response.read()
+                    with metrics.STEAM_DECODE_SECONDS.time():
+                        data = decode_inventory(body)
+                    if data is None:
+                        last_error = "Steam вернул пустой ответ"
+                        continue
 
                     if data.get('success') != 1:
                         if data.get('Error') or data.get('error'):
-                            raise SteamAPIError(data.get('Error') or data.get('error'))
+                            raise InventoryUnavailableError(data.get('Error') or data.get('error'))
                         # Пустой инвентарь — это ОК
-                        return {"assets": [], "descriptions": []}
+                        return {"assets": [], "descriptions": DescriptionIndex([]), "more_items": False}
 
                     return {
-                        "assets": data.get("assets", []),
-                        "descriptions": data.get("descriptions", []),
-                        "more_items": data.get("more_items", False)
+                        "assets": [Asset.from_json(item) for item in data.get("assets") or ()],
+                        "descriptions": DescriptionIndex(data.get("descriptions") or []),
+                        "more_items": bool(data.get("more_items", False)),
+                        "last_assetid": data.get("last_assetid"),
+                        "total_inventory_count": data.get("total_inventory_count", 0),
+                        "etag": response.headers.get("ETag"),
+                        "last_modified": response.headers.get("Last-Modified")
                     }
 
+            except InventoryUnavailableError:
+                # Приватный инвентарь и т.п. — повтор только потратит бюджет запросов
+                raise
             except asyncio.TimeoutError:
-                print(f"⏰ Таймаут (попытка {attempt + 1})")
+                metrics.STEAM_TIMEOUTS.inc()
+                print(f"⏰ Таймаут через {proxy} (попытка {attempt + 1})")
+                self.pool.report_failure(proxy, config.PROXY_ERROR_COOLDOWN)
             except aiohttp.ClientError as e:
-                print(f"🌐 Ошибка сети: {e}")
+                metrics.STEAM_NETWORK_ERRORS.inc()
+                print(f"🌐 Ошибка сети через {proxy}: {e}")
+                self.pool.report_failure(proxy, config.PROXY_ERROR_COOLDOWN)
             except Exception as e:
                 print(f"❌ Ошибка: {e}")
+            finally:
+                self.pool.release(proxy)
+
+        raise SteamAPIError(last_error)
 
-            if attempt < config.MAX_RETRY_ATTEMPTS - 1:
-                await asyncio.sleep(config.STEAM_REQUEST_DELAY * (attempt + 1))
+    async def iter_inventory(self, steamid64: str, appid: int,
+                             contextid: int = 2, count: int = 2000,
+                             etag: Optional[str] = None,
+                             last_modified: Optional[str] = None) -> AsyncIterator[Dict]:
+        """Постранично отдаёт весь инвентарь, следуя last_assetid -> start_assetid"""
+        # Валидаторы относятся к первой странице
+        page = await self.fetch_inventory(steamid64, appid, contextid, count,
+                                          etag=etag, last_modified=last_modified)
+        while True:
+            yield page
 
-        raise SteamAPIError("Не удалось получить инвентарь после нескольких попыток")
+            if not page.get("more_items") or not page.get("last_assetid"):
+                return
+            page = await self.fetch_inventory(steamid64, appid, contextid, count,
+                                              start_assetid=page["last_assetid"])
 
     async def get_new_items(self, steamid64: str, appid: int,
-                            contextid: int = 2) -> List[Dict]:
+                            contextid: int = 2) -> List[InventoryItem]:
         """Сравнивает текущий инвентарь с сохранённым и возвращает новые предметы"""
+        diff = await self.get_inventory_diff(steamid64, appid, contextid)
+        return diff.added
+
+    async def get_inventory_diff(self, steamid64: str, appid: int,
+                                 contextid: int = 2) -> InventoryDiff:
+        """Сравнивает текущий инвентарь со снапшотом и заменяет снапшот текущим"""
         from database import db
 
-        data = await self.fetch_inventory(steamid64, appid, contextid)
-        current_items = data.get("assets", [])
-        descriptions = data.get("descriptions", [])
+        stored = await db.get_fingerprint(steamid64, appid)
+        stored_count, stored_digest, etag, last_modified = stored or (None, None, None, None)
+
+        total_count = None
+        digest = 0
+        # Снапшот читаем, только когда инвентарь точно изменился
+        known = None
+        # Предметы до сверки отпечатка: (ключ, classid, instanceid, описания страницы)
+        pending = []
+        # Весь текущий инвентарь: ключ -> classid
+        current = {}
+        added = {}
+        # Время собственно сравнения, без ожидания Steam и БД
+        spent = 0.0
+
+        def diff(key: int, classid: int, instanceid: int, descriptions: DescriptionIndex):
+            if key not in known:
+                added[key] = InventoryItem(key, classid, self._item_name(appid, classid, instanceid, descriptions))
+
+        async for page in self.iter_inventory(steamid64, appid, contextid,
+                                              etag=etag, last_modified=last_modified):
+            if page.get("not_modified"):
+                return InventoryDiff(total_count=stored_count or 0)
+
+            if total_count is None:
+                total_count = page.get("total_inventory_count", 0)
+                etag, last_modified = page.get("etag"), page.get("last_modified")
+                if total_count != stored_count:
+                    known = await db.get_snapshot(steamid64, appid)
+
+            started = time.perf_counter()
+            descriptions = page["descriptions"]
+            if known is None:
+                # Количество совпало — ждём конца обхода, чтобы сверить отпечаток. До тех пор
+                # держим от страницы только id предметов и компактный индекс описаний
+                descriptions.compact()
+            for asset in page["assets"]:
+                if asset.key in current:
+                    continue
+                current[asset.key] = asset.classid
+                digest = fingerprint_add(digest, asset.key)
+                if known is None:
+                    pending.append((asset.key, asset.classid, asset.instanceid, descriptions))
+                else:
+                    diff(asset.key, asset.classid, asset.instanceid, descriptions)
+            spent += time.perf_counter() - started
+
+        digest_hex = f"{digest:016x}"
+        if known is None:
+            if digest_hex == stored_digest:
+                metrics.DIFF_SECONDS.observe(spent)
+                return InventoryDiff(total_count=total_count)
+            known = await db.get_snapshot(steamid64, appid)
+            started = time.perf_counter()
+            for args in pending:
+                diff(*args)
+        else:
+            started = time.perf_counter()
+
+        removed = {key: classid for key, classid in known.items() if key not in current}
+        # Предметы из снапшотов до появления classid: дописываем его, пока они ещё в инвентаре
+        backfill = {key: current[key] for key, classid in known.items() if classid is None and key in current}
+        spent += time.perf_counter() - started
+
+        # В БД пишем только дельту и только после полного обхода, чтобы обрыв
+        # на середине не испортил снапшот. БД возвращает реально вставленные ключи:
+        # при двух параллельных сравнениях одной цели предмет достаётся тому, кто записал
+        # первым, а второй его не видит. Поэтому /add и /import засевают только цели
+        # без отпечатка — там оба сравнения первичные и уведомлять некого
+        inserted = await db.apply_snapshot_diff(
+            steamid64, appid, {key: current[key] for key in added}, set(removed), backfill
+        )
+        await db.save_fingerprint(steamid64, appid, total_count, digest_hex, etag, last_modified)
 
-        current_hashes = {item_hash(item) for item in current_items}
-        known_hashes = await db.get_item_hashes(steamid64, appid)
+        started = time.perf_counter()
+        # Пара «ушёл + пришёл» с одним classid — возможно, предмет сменил assetid. Отличить его
+        # от другого экземпляра того же класса (второй такой же кейс) нельзя, поэтому по умолчанию выключено
+        removed_by_class = {}
+        if config.DETECT_MOVED_ITEMS:
+            for key, classid in removed.items():
+                if classid is not None:
+                    removed_by_class.setdefault(classid, []).append(key)
 
-        new_hashes = current_hashes - known_hashes
+        result = InventoryDiff(total_count=total_count, initial=stored is None and not known)
+        for key, item in added.items():
+            if key not in inserted:
+                continue
+            same_class = removed_by_class.get(current[key])
+            if same_class:
+                del removed[same_class.pop()]
+                result.moved.append(item)
+            else:
+                result.added.append(item)
 
-        # Сохраняем все текущие хеши
-        await db.save_item_hashes(steamid64, appid, current_hashes)
+        # Описаний ушедших предметов в ответе нет — берём название из кеша, если оно там есть.
+        # Строки без classid — из снапшотов до миграции, где копилась вся история инвентаря:
+        # из БД их удаляем, но об их «уходе» не уведомляем
+        result.removed = [
+            InventoryItem(key, classid, self.name_cache.get(appid, classid) if self.name_cache else None)
+            for key, classid in removed.items() if classid is not None
+        ]
+        metrics.DIFF_SECONDS.observe(spent + time.perf_counter() - started)
+        return result
 
-        # Возвращаем только новые предметы с форматированными названиями
-        return [
-            {
-                **item,
-                "display_name": format_item_name(item, descriptions)
-            }
-            for item in current_items
-            if item_hash(item) in new_hashes
-        ]
\ No newline at end of file
+    def _item_name(self, appid: int, classid: int, instanceid: int,
+                   descriptions: DescriptionIndex) -> Optional[str]:
+        """Название из кеша или описаний; None, если описания нет"""
+        name = self.name_cache.get(appid, classid) if self.name_cache else None
+        if name is None:
+            desc = descriptions.get(classid, instanceid)
+            name = desc.name if desc else None
+            if name and self.name_cache:
+                self.name_cache.put(appid, classid, name)
+        return name
@@ -0,0 +1,76 @@
+"""Декодирование ответов /inventory: только поля, нужные диффу и названиям предметов.
+
+msgspec (в requirements.txt; код работает и без него) разбирает ответ сразу в словари
+с нужными ключами и пропускает остальное — тяжёлые блобы descriptions не материализуются
+вовсе. Без него — orjson или стандартный json: они разбирают тело целиком, и отбор полей
+после разбора пик памяти не снижает, поэтому его нет. Сырые описания отпускает
+DescriptionIndex.compact после построения индекса.
+"""
+import json
+from typing import Callable, TypedDict
+from config import config
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class Asset(TypedDict, total=False):
+    assetid: str | int
+    classid: str | int
+    instanceid: str | int
+    amount: str | int
+
+
+class Description(TypedDict, total=False):
+    classid: str | int
+    instanceid: str | int
+    market_hash_name: str
+    name: str
+
+
+class InventoryResponse(TypedDict, total=False):
+    success: int | bool
+    assets: list[Asset]
+    descriptions: list[Description]
+    more_items: int | bool
+    last_assetid: str | int
+    total_inventory_count: int
+    error: str
+    Error: str
+
+
+def _decode_msgspec() -> Callable[[bytes], dict | None]:
+    # На ошибках Steam иногда отвечает телом null
+    decoder = msgspec.json.Decoder(InventoryResponse | None)
+    return decoder.decode
+
+
+def _decode_orjson(body: bytes) -> dict | None:
+    data = orjson.loads(body)
+    return data if isinstance(data, dict) else None
+
+
+def _decode_stdlib(body: bytes) -> dict | None:
+    data = json.loads(body)
+    return data if isinstance(data, dict) else None
+
+
+def get_decoder(name: str = "auto") -> Callable[[bytes], dict | None]:
+    """auto — самый быстрый из доступных: msgspec, orjson, затем стандартный json"""
+    if name in ("auto", "msgspec") and msgspec is not None:
+        return _decode_msgspec()
+    if name in ("auto", "orjson") and orjson is not None:
+        return _decode_orjson
+    if name not in ("auto", "json"):
+        print(f"⚠️ Декодер {name} недоступен, используется стандартный json")
+    return _decode_stdlib
+
+
+decode_inventory = get_decoder(config.JSON_DECODER)
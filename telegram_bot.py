@@ -1,12 +1,16 @@
 import re
+import asyncio
 import logging
 from typing import Optional
 from aiogram import Bot, Dispatcher, types, F
 from aiogram.filters import Command, CommandStart
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
 from config import config
-from steam_api import SteamInventoryFetcher, SteamAPIError, item_hash
+from steam_api import SteamInventoryFetcher, SteamAPIError
 from database import db
+from importer import WatchlistImport, parse_watchlist
+from state_store import create_state_store
+from profiler import profiler
 
 logger = logging.getLogger(__name__)
 
@@ -24,6 +28,12 @@ def extract_steamid64(url: str) -> Optional[str]:
     return None
 
 
+# Названия предметов приходят из Steam: служебные символы Markdown в них экранируем,
+# иначе Telegram отклонит всё сообщение вместе с остальными уведомлениями пачки
+def escape_markdown(text: str) -> str:
+    return re.sub(r'([_*`\[])', r'\\\1', text)
+
+
 # Inline-клавиатура с играми
 def get_games_keyboard() -> InlineKeyboardMarkup:
     games = [("CS2", 730), ("Dota 2", 570), ("TF2", 440)]
@@ -34,10 +44,14 @@ def get_games_keyboard() -> InlineKeyboardMarkup:
 
 
 class InventoryBot:
-    def __init__(self, bot: Bot, dp: Dispatcher):
+    def __init__(self, bot: Bot, dp: Dispatcher, fetcher: SteamInventoryFetcher):
         self.bot = bot
         self.dp = dp
-        self.pending_additions = {}
+        self.fetcher = fetcher
+        # Незавершённые добавления: с TTL и ограничением размера, по желанию — в БД
+        self.pending_additions = create_state_store()
+        # Фоновые задачи (засев импорта): держим ссылки, чтобы их не собрал GC
+        self._background: set[asyncio.Task] = set()
         self._register_handlers()
 
     def _register_handlers(self):
@@ -51,7 +65,9 @@ class InventoryBot:
         self.dp.message(CommandStart())(self.cmd_start)
         self.dp.message(Command("add"))(self.cmd_add)
         self.dp.message(Command("list"))(self.cmd_list)
-        self.dp.message(Command("remove"))(self.cmd_remove_prompt)
+        self.dp.message(Command("remove"))(self.cmd_remove)
+        self.dp.message(Command("import"))(self.cmd_import)
+        self.dp.message(Command("profile"))(self.cmd_profile)
 
         # 3. Текстовые кнопки
         self.dp.message(F.text == "➕ Добавить")(self.on_add_button)
@@ -79,6 +95,7 @@ class InventoryBot:
             "Команды:\n"
             "/add — добавить вручную\n"
             "/list — показать отслеживаемые\n"
+            "/import — добавить список инвентарей\n"
             "/remove — удалить из отслеживания",
             reply_markup=kb
         )
@@ -90,7 +107,7 @@ class InventoryBot:
             "Пример: `https://steamcommunity.com/profiles/76561199109461098/inventory/`",
             parse_mode="Markdown"
         )
-        self.pending_additions[message.from_user.id] = {"url": None, "game": None}
+        await self.pending_additions.set(message.from_user.id, {"url": None, "game": None})
 
     async def on_add_button(self, message: types.Message):
         logger.info(f"📩 Кнопка '➕ Добавить' от {message.from_user.id}")
@@ -117,11 +134,11 @@ class InventoryBot:
                 )
                 return
 
-            self.pending_additions[tg_id] = {
+            await self.pending_additions.set(tg_id, {
                 "url": message.text,
                 "steamid64": steamid64,
                 "game": None
-            }
+            })
 
             await message.answer(
                 f"✅ SteamID: `{steamid64}`\n\n"
@@ -139,7 +156,7 @@ class InventoryBot:
             await message.answer("❌ Не удалось распознать SteamID. Проверьте ссылку.")
             return
 
-        self.pending_additions[tg_id] = {"url": message.text, "steamid64": steamid64, "game": None}
+        await self.pending_additions.set(tg_id, {"url": message.text, "steamid64": steamid64, "game": None})
 
         await message.answer(
             f"✅ SteamID: `{steamid64}`\n\n"
@@ -152,30 +169,30 @@ class InventoryBot:
         tg_id = callback.from_user.id
         logger.info(f"🎮 Выбрана игра: {callback.data} от {tg_id}")
 
-        if tg_id not in self.pending_additions:
+        data = await self.pending_additions.get(tg_id)
+        if data is None or not data.get("steamid64"):
             await callback.answer("⚠️ Сессия истекла. Начните сначала.", show_alert=True)
             return
 
         if callback.data == "cancel":
-            del self.pending_additions[tg_id]
+            await self.pending_additions.delete(tg_id)
             await callback.message.edit_text("❌ Отменено.")
             return
 
         appid = int(callback.data.split("_")[1])
-        data = self.pending_additions[tg_id]
         steamid64 = data["steamid64"]
 
         success = await db.add_tracked_user(tg_id, steamid64, appid)
 
         if success:
-            async with SteamInventoryFetcher(proxy=config.PROXY_URL) as fetcher:
-                try:
-                    inv_data = await fetcher.fetch_inventory(steamid64, appid)
-                    hashes = {item_hash(item) for item in inv_data.get("assets", [])}
-                    await db.save_item_hashes(steamid64, appid, hashes)
+            try:
+                # Засеваем только новую цель: у отслеживаемой снапшот уже есть, а наш diff
+                # забрал бы себе предметы, о которых планировщик должен уведомить подписчиков
+                if await db.get_fingerprint(steamid64, appid) is None:
+                    await self.fetcher.get_new_items(steamid64, appid)
                     logger.info(f"✅ Инициализирован снапшот для {steamid64}/{appid}")
-                except Exception as e:
-                    logger.warning(f"⚠️ Не удалось инициализировать снапшот: {e}")
+            except Exception as e:
+                logger.warning(f"⚠️ Не удалось инициализировать снапшот: {e}")
 
             game_name = next((n for n, a in [("CS2", 730), ("Dota 2", 570), ("TF2", 440)] if a == appid), str(appid))
             await callback.message.edit_text(
@@ -186,19 +203,18 @@ class InventoryBot:
         else:
             await callback.message.edit_text("❌ Уже отслеживается или ошибка БД.")
 
-        del self.pending_additions[tg_id]
+        await self.pending_additions.delete(tg_id)
         await callback.answer()
 
     async def on_cancel(self, callback: types.CallbackQuery):
         tg_id = callback.from_user.id
-        if tg_id in self.pending_additions:
-            del self.pending_additions[tg_id]
+        await self.pending_additions.delete(tg_id)
         await callback.message.edit_text("❌ Отменено.")
         await callback.answer()
 
     async def cmd_list(self, message: types.Message):
         logger.info(f"📩 /list от {message.from_user.id}")
-        tracked = await db.get_tracked_users(tg_user_id=message.from_user.id)
+        tracked = db.get_user_tracks(message.from_user.id)
         if not tracked:
             await message.answer("📭 Вы пока ничего не отслеживаете.\nНажмите '➕ Добавить', чтобы начать.")
             return
@@ -212,7 +228,81 @@ class InventoryBot:
         text += "\nЧтобы удалить: `/remove 76561199109461098 730`"
         await message.answer(text, parse_mode="Markdown")
 
-    async def cmd_remove_prompt(self, message: types.Message):
+    async def cmd_import(self, message: types.Message):
+        """Массовое добавление: список ссылок/SteamID64 в сообщении или в приложенном файле"""
+        tg_id = message.from_user.id
+        logger.info(f"📩 /import от {tg_id}")
+
+        text = re.sub(r'^/import(@\w+)?', '', message.text or message.caption or "", count=1)
+        if message.document:
+            if message.document.file_size and message.document.file_size > config.IMPORT_MAX_FILE_BYTES:
+                await message.answer(f"❌ Файл больше {config.IMPORT_MAX_FILE_BYTES // 1000} КБ")
+                return
+            file = await self.bot.download(message.document)
+            text += "\n" + file.read().decode("utf-8", errors="replace")
+
+        targets, invalid = parse_watchlist(text)
+        if not targets:
+            await message.answer(
+                "📥 Формат: `/import`, а следом — по одной цели на строку "
+                "(или приложите .txt файл с подписью /import):\n"
+                "`https://steamcommunity.com/profiles/76561199109461098/inventory/#730`\n"
+                "`76561199109461098 570`\n\n"
+                "AppID по умолчанию: 730 (CS2)",
+                parse_mode="Markdown"
+            )
+            return
+        if len(targets) > config.IMPORT_MAX_TARGETS:
+            await message.answer(f"❌ Слишком длинный список: {len(targets)} (максимум {config.IMPORT_MAX_TARGETS})")
+            return
+
+        # Одна транзакция на весь список; засев снапшотов — в фоне
+        new = await db.add_tracked_users(tg_id, targets)
+        status = await message.answer(f"📥 Импорт: добавлено {len(new)} целей, засеваю снапшоты...")
+        job = WatchlistImport(self.fetcher, status, new, len(targets) - len(new), invalid)
+        task = asyncio.create_task(job.run())
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def cmd_profile(self, message: types.Message):
+        """/profile [N] — профилировать следующие N циклов проверки (только ADMIN_IDS)"""
+        tg_id = message.from_user.id
+        if tg_id not in config.ADMIN_IDS:
+            return
+        logger.info(f"📩 /profile от {tg_id}")
+        if config.ROLE != "all":
+            await message.answer("⚠️ Проверки идут в воркерах — задайте им PROFILE_CYCLES.")
+            return
+
+        parts = message.text.split()
+        cycles = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else 1
+        cycles = max(1, min(cycles, 100))
+
+        async def on_done(path: str, summary: str):
+            await self.bot.send_message(tg_id, f"🔬 Профиль готов: {path}\n\n{summary}")
+
+        if not profiler.arm(cycles, on_done):
+            await message.answer("⏳ Профилирование уже идёт.")
+            return
+        await message.answer(f"🔬 Профилирую следующие {cycles} циклов проверки — пришлю сводку.")
+
+    async def cmd_remove(self, message: types.Message):
+        """/remove <SteamID64> [AppID]; без аргументов — подсказка по формату"""
+        tg_id = message.from_user.id
+        parts = message.text.split()[1:]
+        if parts and parts[0].isdigit() and (len(parts) == 1 or parts[1].isdigit()):
+            steamid64 = parts[0]
+            appid = int(parts[1]) if len(parts) > 1 else config.DEFAULT_APPID
+            logger.info(f"📩 /remove {steamid64}/{appid} от {tg_id}")
+            if (steamid64, appid) not in {(s, a) for _, s, a, _ in db.get_user_tracks(tg_id)}:
+                await message.answer("📭 Этот инвентарь не отслеживается.")
+                return
+            if await db.remove_tracked_user(tg_id, steamid64, appid):
+                await message.answer(f"🗑️ Больше не отслеживаю {steamid64} (AppID {appid}).")
+            else:
+                await message.answer("❌ Ошибка БД, попробуйте позже.")
+            return
+
         await message.answer(
             "🗑️ Формат: `/remove <SteamID64> [AppID]`\n"
             "Пример: `/remove 76561199109461098 730`\n\n"
@@ -222,20 +312,51 @@ class InventoryBot:
 
 
 
-    async def send_new_items_notification(self, tg_user_id: int, steamid64: str,
-                                          appid: int, new_items: list):
+    def format_new_items(self, steamid64: str, appid: int, new_items: list) -> str:
         game = next((n for n, a in [("CS2", 730), ("Dota 2", 570), ("TF2", 440)] if a == appid), f"AppID:{appid}")
 
         text = f"🎁 **Новые предметы!**\n👤 `{steamid64}` | 🎮 {game}\n\n"
 
         for item in new_items[:config.MAX_ITEMS_PER_NOTIFICATION]:
-            name = item.get('display_name', f"Item #{item.get('classid')}")
+            name = escape_markdown(item.name) if item.name else f"Item #{item.classid}"
             text += f"• {name}\n"
 
         if len(new_items) > config.MAX_ITEMS_PER_NOTIFICATION:
             text += f"\n_... и ещё {len(new_items) - config.MAX_ITEMS_PER_NOTIFICATION} предметов_"
 
-        await self.bot.send_message(tg_user_id, text, parse_mode="Markdown")
+        return text
+
+    def format_removed_items(self, steamid64: str, appid: int, removed_items: list) -> str:
+        game = next((n for n, a in [("CS2", 730), ("Dota 2", 570), ("TF2", 440)] if a == appid), f"AppID:{appid}")
+
+        text = f"📤 **Предметы ушли из инвентаря**\n👤 `{steamid64}` | 🎮 {game}\n\n"
+
+        for item in removed_items[:config.MAX_ITEMS_PER_NOTIFICATION]:
+            # У предметов из старых снапшотов classid может не быть
+            name = escape_markdown(item.name) if item.name else (
+                f"Item #{item.classid}" if item.classid is not None else "Предмет без описания"
+            )
+            text += f"• {name}\n"
+
+        if len(removed_items) > config.MAX_ITEMS_PER_NOTIFICATION:
+            text += f"\n_... и ещё {len(removed_items) - config.MAX_ITEMS_PER_NOTIFICATION} предметов_"
+
+        return text
+
+    def format_notification_batch(self, batch: list) -> str:
+        """Склеивает несколько уведомлений для одного чата в одно сообщение"""
+        formatters = {"added": self.format_new_items, "removed": self.format_removed_items}
+        parts = []
+        length = 0
+        for i, (kind, steamid64, appid, items) in enumerate(batch):
+            part = formatters[kind](steamid64, appid, items)
+            # Лимит Telegram — 4096 символов, оставляем запас на хвост
+            if parts and length + len(part) > 3800:
+                parts.append(f"_... и ещё {len(batch) - i} уведомлений_")
+                break
+            parts.append(part)
+            length += len(part)
+        return "\n".join(parts)
 
     async def on_debug_message(self, message: types.Message):
         """Показывает все необработанные сообщения"""
@@ -0,0 +1,95 @@
+import asyncio
+import logging
+import secrets
+from typing import Optional
+from aiogram import Bot, Dispatcher, types
+from aiohttp import web
+import metrics
+from config import config
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookServer:
+    """Принимает обновления Telegram на aiohttp-сервере в том же event loop, что и планировщик.
+
+    На запрос отвечаем сразу, а обновление обрабатываем в фоне: так Telegram не ждёт
+    хендлеры (/add ходит в Steam). Одновременно в обработке не больше max_concurrency
+    обновлений — когда слоты заняты, запрос ждёт свободного, и Telegram сам сбавляет темп.
+    """
+
+    def __init__(self, bot: Bot, dp: Dispatcher, secret: str = None, max_concurrency: int = None):
+        self.bot = bot
+        self.dp = dp
+        self.secret = secret if secret is not None else config.WEBHOOK_SECRET
+        self.max_concurrency = max_concurrency or config.WEBHOOK_MAX_CONCURRENCY
+        self._slots = asyncio.Semaphore(self.max_concurrency)
+        self._tasks: set[asyncio.Task] = set()
+        self._runner: Optional[web.AppRunner] = None
+        metrics.WEBHOOK_IN_FLIGHT.set_function(lambda: len(self._tasks))
+
+    def make_app(self, path: str = None) -> web.Application:
+        app = web.Application()
+        app.router.add_post(path or config.WEBHOOK_PATH, self.handle)
+        # Метрики — на этом же сервере, отдельный порт не нужен
+        app.router.add_get("/metrics", metrics.handle_metrics)
+        return app
+
+    async def start(self, host: str = None, port: int = None):
+        """Поднимает сервер и регистрирует вебхук; ошибки запуска не глотаем — без сервера бот глух"""
+        host = host or config.WEBHOOK_HOST
+        port = port or config.WEBHOOK_PORT
+        self._runner = web.AppRunner(self.make_app(), access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        logger.info(f"🌐 Вебхук слушает http://{host}:{port}{config.WEBHOOK_PATH}")
+
+        await self.bot.set_webhook(
+            config.WEBHOOK_URL,
+            secret_token=self.secret,
+            max_connections=min(self.max_concurrency, 100),
+            allowed_updates=self.dp.resolve_used_update_types(),
+        )
+        logger.info(f"✅ Вебхук зарегистрирован: {config.WEBHOOK_URL}")
+
+    async def stop(self):
+        """Перестаёт принимать запросы и дожидается обновлений в обработке.
+
+        Вебхук у Telegram не снимаем: пока бот перезапускается, обновления копятся у Telegram.
+        """
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if self.secret and not secrets.compare_digest(request.headers.get(SECRET_HEADER, ""), self.secret):
+            metrics.WEBHOOK_UPDATES.labels("unauthorized").inc()
+            return web.Response(status=401)
+        try:
+            update = types.Update.model_validate(await request.json(), context={"bot": self.bot})
+        except ValueError as e:
+            # Битое тело: повтор от Telegram не поможет, но и 200 отвечать не за что
+            metrics.WEBHOOK_UPDATES.labels("invalid").inc()
+            logger.warning(f"⚠️ Некорректное обновление на вебхуке: {e}")
+            return web.Response(status=400)
+
+        await self._slots.acquire()
+        task = asyncio.create_task(self._process(update))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return web.Response()
+
+    async def _process(self, update: types.Update):
+        try:
+            with metrics.WEBHOOK_HANDLE_SECONDS.time():
+                await self.dp.feed_update(self.bot, update)
+            metrics.WEBHOOK_UPDATES.labels("ok").inc()
+        except Exception as e:
+            metrics.WEBHOOK_UPDATES.labels("error").inc()
+            logger.error(f"❌ Ошибка обработки обновления {update.update_id}: {e}")
+        finally:
+            self._slots.release()